@@ -0,0 +1,165 @@
+# Scaling benchmark of Kanalhaltungen-anpassen.py on synthetic sewer networks (see generate.py).
+#
+# For every size, a network is generated, the script runs on it in a separate process and the stage times are taken
+# from its profile.json. The outputs are checked against golden digests (golden.json) and optionally against the
+# outputs of a reference version of the script.
+#
+# Usage: python benchmarks/benchmark.py [--sizes 1000,10000,100000,1000000] [--density 1] [--seed 1] [--sub]
+#                                       [--backend local|arcpy] [--script <path>] [--reference <script>]
+#                                       [--work <folder>] [--update-golden]
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import subprocess
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_FOLDER))
+
+from subvision.shapefiles import readShapefile
+from generate import writeNetwork
+
+SCRIPT = os.path.join(os.path.dirname(BENCHMARK_FOLDER), "Kanalhaltungen-anpassen.py")
+GOLDEN = os.path.join(BENCHMARK_FOLDER, "golden.json")
+OUTPUTS = ("haltungen_out_lines.shp", "anschluss_out_lines.shp")
+
+# Stages of the pipeline as (function, name of the Timer in the script)
+STAGES = [
+    ("setup", "Setup"),
+    ("copyFeature", "Kopieren"),
+    ("convertFeatureToPoints", "Zu Punkte konvertieren"),
+    ("interpolateFeatureZ", "3D Daten anpassen (Haltungen)"),
+    ("adjust3DZbyReference", "3D Daten anpassen (Anschlussdaten)"),
+    ("pointsToLine", "Zu Linien konvertieren"),
+]
+
+def runScript(script, inputs, output, subInterpolate, backend):
+    """Runs the script on the inputs in a new process.
+
+    :returns: The wall time of the whole process in seconds.
+    """
+    if os.path.isdir(output):
+        shutil.rmtree(output) # Start without the incremental cache of earlier runs
+    os.makedirs(output)
+    environment = dict(os.environ, SUBVISION_BACKEND=backend)
+    startTime = time.time()
+    result = subprocess.run([sys.executable, script] + list(inputs) + [output, "false", "true" if subInterpolate else "false"],
+                            env=environment, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError("{0} failed:\n{1}".format(script, result.stdout[-3000:]))
+    return time.time() - startTime
+
+def lineVertices(path):
+    """:returns: The vertices of every line of a shapefile as (x, y, z) tuples, in FID order."""
+    return [[tuple(vertex[:3]) for part in shape for vertex in part] for shape in readShapefile(path).shapes]
+
+def outputDigest(path):
+    """A hash of the line geometries of an output, rounded to micrometers so it doesn't depend on the platform."""
+    digest = hashlib.sha1()
+    for vertices in lineVertices(path):
+        digest.update(";".join("{0:.6f},{1:.6f},{2:.6f}".format(*vertex) for vertex in vertices).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+def maxDifference(pathA, pathB):
+    """:returns: The largest coordinate difference between the lines of two outputs, None if their lines don't match up."""
+    linesA = lineVertices(pathA)
+    linesB = lineVertices(pathB)
+    if [len(vertices) for vertices in linesA] != [len(vertices) for vertices in linesB]:
+        return None
+    difference = 0
+    for verticesA, verticesB in zip(linesA, linesB):
+        for vertexA, vertexB in zip(verticesA, verticesB):
+            difference = max([difference] + [abs(a - b) for a, b in zip(vertexA, vertexB)])
+    return difference
+
+def stageTimes(output):
+    """:returns: {function: seconds} per stage from the profile.json of a run, empty if the script wrote none."""
+    path = os.path.join(output, "profile.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        profile = json.load(file)
+    result = {}
+    for stage in profile["stages"]:
+        for function, name in STAGES:
+            if stage["name"] == name or stage["name"].startswith(name + " ("): # Stages per feature class, e.g. "Kopieren (Haltungen)"
+                result[function] = result.get(function, 0) + stage["wallTime"]
+    result["peakMemory"] = profile["total"]["peakMemory"]
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Skalierungs-Benchmark von Kanalhaltungen-anpassen.py")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="Anzahl Vertices je Netz, kommagetrennt")
+    parser.add_argument("--density", type=float, default=1.0, help="Anschlussdichte, 1 schließt etwa jeden Haltungs-Vertex an")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--sub", action="store_true", help="Mit Sub-Interpolation")
+    parser.add_argument("--backend", default="local", choices=("local", "arcpy"))
+    parser.add_argument("--script", default=SCRIPT, help="Das zu messende Skript")
+    parser.add_argument("--reference", help="Eine Referenzversion des Skripts, deren Ausgaben verglichen werden")
+    parser.add_argument("--work", default=os.path.join(BENCHMARK_FOLDER, "work"), help="Arbeitsordner für Eingaben und Ausgaben")
+    parser.add_argument("--update-golden", action="store_true", help="Golden-Referenz mit den Ausgaben dieses Laufs überschreiben")
+    arguments = parser.parse_args()
+
+    golden = {}
+    if os.path.exists(GOLDEN):
+        with open(GOLDEN) as file:
+            golden = json.load(file)
+
+    results = []
+    failed = False
+    print("{0:>9} {1:>8} {2:>8} {3:>8} {4:>8} {5:>8} {6:>8} {7:>8} {8:>9}  {9}".format(
+        "Vertices", "Setup", "Kopieren", "Punkte", "Haltung", "Anschl.", "Linien", "Gesamt", "Speicher", "Prüfung"))
+    for size in [int(size) for size in arguments.sizes.split(",")]:
+        key = "{0}-{1:g}-{2}-{3}".format(size, arguments.density, arguments.seed, "sub" if arguments.sub else "nosub")
+        folder = os.path.join(arguments.work, key)
+        inputs = writeNetwork(os.path.join(folder, "input"), size, arguments.density, arguments.seed)
+        vertexCount = inputs.pop()
+
+        output = os.path.join(folder, "output")
+        wallTime = runScript(arguments.script, inputs, output, arguments.sub, arguments.backend)
+        times = stageTimes(output)
+
+        # Golden digests
+        digests = dict((name, outputDigest(os.path.join(output, name))) for name in OUTPUTS)
+        if arguments.update_golden:
+            check = "aktualisiert" if key in golden else "neu"
+            golden[key] = digests
+        elif key not in golden:
+            check = "kein golden-Wert"
+        elif golden[key] == digests:
+            check = "golden OK"
+        else:
+            check = "golden ABWEICHUNG"
+            failed = True
+
+        # Reference version of the script
+        if arguments.reference:
+            referenceOutput = os.path.join(folder, "reference")
+            runScript(arguments.reference, inputs, referenceOutput, arguments.sub, arguments.backend)
+            differences = [maxDifference(os.path.join(output, name), os.path.join(referenceOutput, name)) for name in OUTPUTS]
+            if None in differences or max(differences) > 1e-6:
+                check += ", Referenz ABWEICHUNG {0}".format(differences)
+                failed = True
+            else:
+                check += ", Referenz OK"
+
+        results.append({"key": key, "vertices": vertexCount, "wallTime": wallTime, "stages": times, "check": check})
+        print("{0:>9} {1:>8.2f} {2:>8.2f} {3:>8.2f} {4:>8.2f} {5:>8.2f} {6:>8.2f} {7:>8.2f} {8:>8.0f}M  {9}".format(
+            vertexCount, *([times.get(function, 0) for function, name in STAGES] + [wallTime, (times.get("peakMemory") or 0) / 1e6, check])))
+
+    if not os.path.isdir(arguments.work):
+        os.makedirs(arguments.work)
+    with open(os.path.join(arguments.work, "benchmark.json"), "w") as file:
+        json.dump(results, file, indent=4)
+    if arguments.update_golden:
+        with open(GOLDEN, "w") as file:
+            json.dump(golden, file, indent=4, sort_keys=True)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Synthetic sewer networks for the benchmarks of Kanalhaltungen-anpassen.py.
+#
+# Manholes (Schächte) lie on a jittered street grid, Haltungen run between neighbouring manholes with a few
+# vertices in between, Anschlussleitungen start at Haltung vertices and lead away from them. The network covers
+# the cases the script has to handle: sagging Haltung vertices, Haltungen drawn against the flow direction,
+# connections snapped exactly or within the XY tolerance, connections chained to other connections,
+# Haltungen without a manhole at one end and Haltungen that start and end at the same manhole.
+#
+# Usage: python benchmarks/generate.py <output folder> <vertices> [connection density] [seed]
+
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from subvision.shapefiles import Field, FeatureClass, writeShapefile, shapeTypeCode
+
+# Average vertex counts per manhole, used to size the grid for a vertex count
+HALTUNG_VERTICES_PER_MANHOLE = 12
+ANSCHLUSS_VERTICES_PER_MANHOLE = 27 # At connection density 1
+LOOP_MANHOLES = 100 # Every so many manholes get a Haltung that starts and ends at them
+
+def generateNetwork(vertexCount, density=1.0, snapOffset=.001, missingManholes=.01, seed=1):
+    """**Generates a synthetic sewer network** with roughly vertexCount vertices in Haltungen and Anschlussleitungen.
+
+    :param int vertexCount: The approximate number of line vertices.
+    :param float density: [optional] Anschlussleitungen per intermediate Haltung vertex and side, 1 connects about every vertex.
+    :param float snapOffset: [optional] XY offset of connections that are snapped within the tolerance instead of exactly.
+    :param float missingManholes: [optional] The share of manholes left out of the Schacht feature class.
+    :param int seed: [optional] The random seed, the same arguments always give the same network.
+    :returns: haltungen, anschluesse, schaechte as FeatureClass
+    """
+    rnd = random.Random(seed)
+    side = max(2, int(round((vertexCount / (HALTUNG_VERTICES_PER_MANHOLE + ANSCHLUSS_VERTICES_PER_MANHOLE * density)) ** .5)))
+
+    # Manholes on a jittered grid, Z falls towards one corner
+    manholes = {}
+    for i in range(side):
+        for j in range(side):
+            x = 3480000.0 + i * 45 + rnd.uniform(-5, 5)
+            y = 5880000.0 + j * 40 + rnd.uniform(-5, 5)
+            z = 20.0 - (i + j) * .15 + rnd.uniform(-.1, .1)
+            manholes[i, j] = (x, y, z)
+
+    schaechte = FeatureClass(shapeTypeCode("Point", True), [Field("schacht_X", "Double"), Field("schacht_Y", "Double"),
+                                                            Field("schacht_XY", "Double"), Field("Z", "Double")])
+    present = [] # Manholes in the Schacht feature class
+    for key in sorted(manholes):
+        if rnd.random() < missingManholes:
+            continue
+        x, y, z = manholes[key]
+        present.append(manholes[key])
+        schaechte.records.append([x, y, x + y, z])
+        schaechte.shapes.append((x, y, z, None))
+
+    # Haltungen between neighbouring manholes, intermediate vertices sag below the straight line
+    haltungen = FeatureClass(shapeTypeCode("Polyline", True), [Field("NAME", "String", 20)])
+    connectable = [] # Intermediate Haltung vertices
+    for (i, j) in sorted(manholes):
+        for neighbour in ((i + 1, j), (i, j + 1)):
+            if neighbour not in manholes:
+                continue
+            (x1, y1, z1), (x2, y2, z2) = manholes[i, j], manholes[neighbour]
+            segments = rnd.randint(2, 8)
+            vertices = []
+            for k in range(segments + 1):
+                factor = float(k) / segments
+                sag = rnd.uniform(0, .8) if 0 < k < segments else rnd.uniform(0, .4)
+                vertices.append((x1 + (x2 - x1) * factor, y1 + (y2 - y1) * factor, z1 + (z2 - z1) * factor - sag, None))
+            if rnd.random() < .5:
+                vertices.reverse() # Drawn against the flow direction
+            haltungen.records.append(["H{0}".format(len(haltungen.records))])
+            haltungen.shapes.append([vertices])
+            connectable.extend(vertices[1:-1])
+
+    # Haltungen that start and end at the same manhole, they can't be interpolated. Added without random numbers,
+    # so the rest of the network stays the same
+    for x, y, z in present[::LOOP_MANHOLES]:
+        vertices = [(x, y, z - .3, None), (x + 3, y, z - .5, None), (x + 3, y + 3, z - .6, None), (x, y, z - .3, None)]
+        haltungen.records.append(["H{0}".format(len(haltungen.records))])
+        haltungen.shapes.append([vertices])
+
+    # Anschlussleitungen from Haltung vertices to the houses, some snapped within the tolerance only
+    anschluesse = FeatureClass(shapeTypeCode("Polyline", True), [Field("NAME", "String", 20)])
+    houseEnds = []
+    for vertex in connectable:
+        for direction in (-1, 1):
+            if rnd.random() >= density / 2:
+                continue
+            x, y, z = vertex[:3]
+            if rnd.random() < .3:
+                x += snapOffset
+            vertices = [(x, y, z + rnd.uniform(0, .3), None)]
+            for k in range(rnd.randint(1, 3)):
+                x += direction * rnd.uniform(2, 6)
+                y += rnd.uniform(-2, 2)
+                z += rnd.uniform(.1, .6)
+                vertices.append((x, y, z, None))
+            houseEnds.append(vertices[-1])
+            if rnd.random() < .5:
+                vertices.reverse()
+            anschluesse.records.append(["A{0}".format(len(anschluesse.records))])
+            anschluesse.shapes.append([vertices])
+
+    # Connections chained to the house end of other connections
+    for vertex in rnd.sample(houseEnds, len(houseEnds) // 5):
+        x, y, z = vertex[:3]
+        vertices = [(x, y, z - rnd.uniform(0, .3), None)]
+        for k in range(rnd.randint(1, 2)):
+            x += rnd.uniform(-3, 3)
+            y += rnd.uniform(2, 5)
+            z += rnd.uniform(-.2, .4)
+            vertices.append((x, y, z, None))
+        anschluesse.records.append(["B{0}".format(len(anschluesse.records))])
+        anschluesse.shapes.append([vertices])
+
+    return haltungen, anschluesse, schaechte
+
+def vertexCountOf(featureClass):
+    """:returns: The number of vertices of all lines of a feature class."""
+    return sum(len(part) for shape in featureClass.shapes for part in shape)
+
+def writeNetwork(folder, vertexCount, density=1.0, seed=1):
+    """Generates a network and writes it as haltungen.shp, anschluesse.shp and schaechte.shp.
+
+    :param string folder: The folder to write to, created if it doesn't exist.
+    :returns: The paths of haltungen, anschluesse and schaechte and the actual number of line vertices.
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    haltungen, anschluesse, schaechte = generateNetwork(vertexCount, density, seed=seed)
+    paths = [os.path.join(folder, name) for name in ("haltungen.shp", "anschluesse.shp", "schaechte.shp")]
+    for path, featureClass in zip(paths, (haltungen, anschluesse, schaechte)):
+        writeShapefile(path, featureClass)
+    return paths + [vertexCountOf(haltungen) + vertexCountOf(anschluesse)]
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit("Usage: python benchmarks/generate.py <output folder> <vertices> [connection density] [seed]")
+    result = writeNetwork(sys.argv[1], int(sys.argv[2]), float(sys.argv[3]) if len(sys.argv) > 3 else 1.0,
+                          int(sys.argv[4]) if len(sys.argv) > 4 else 1)
+    print("{0} Vertices geschrieben: {1}, {2}, {3}".format(result[3], *result[:3]))
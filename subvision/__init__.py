@@ -0,0 +1,4 @@
+# SubVision
+#
+# Shared code of the SubVision scripts. The geoprocessing calls go through a backend,
+# either ArcGIS (arcpy) or a local shapefile implementation that runs without ArcGIS.
@@ -0,0 +1,325 @@
+# Backend interface for all geoprocessing calls of the SubVision scripts.
+#
+# ArcpyBackend forwards to arcpy and needs a licensed ArcGIS installation.
+# LocalBackend (localbackend.py) works on shapefiles and GeoPackages with plain Python/NumPy and runs anywhere.
+
+import os
+
+class Backend:
+    """**Geoprocessing backend**, the methods mirror the arcpy functions the scripts use.
+    Feature classes are passed as paths or as names relative to the workspace.
+    """
+    name = None # The name to create the backend with, see getBackend
+    workspace = None
+
+    def setWorkspace(self, path):
+        """Sets the folder relative feature class names are resolved in. Existing outputs get overwritten.
+
+        :param string path: The workspace folder.
+        """
+        raise NotImplementedError
+
+    def memoryPath(self, name):
+        """Returns the path of a feature class that is only kept in memory and never written to disk.
+
+        :param string name: The name of the feature class.
+        """
+        raise NotImplementedError
+
+    def createContainer(self, path):
+        """Creates a file geodatabase (.gdb) or GeoPackage (.gpkg) to store many feature classes in, e.g. <path>/<name>.
+        An existing one is kept.
+
+        :param string path: The path of the container.
+        """
+        raise NotImplementedError
+
+    def releaseFeatures(self):
+        """Releases the feature classes the backend keeps loaded or locked, including memory feature classes,
+        e.g. between the jobs of a long running process."""
+        raise NotImplementedError
+
+    # Tool parameters and messages
+    def getParameterAsText(self, index):
+        raise NotImplementedError
+
+    def getParameter(self, index):
+        raise NotImplementedError
+
+    def addMessage(self, message):
+        raise NotImplementedError
+
+    def setProgressor(self, type, label, minimum=0, maximum=100):
+        raise NotImplementedError
+
+    def setProgressorLabel(self, label):
+        raise NotImplementedError
+
+    def setProgressorPosition(self, position=None):
+        raise NotImplementedError
+
+    # Describing data
+    def exists(self, feature):
+        raise NotImplementedError
+
+    def oidField(self, feature):
+        """:returns: The name of the object ID field, e.g. FID in shapefiles and OBJECTID in file geodatabases."""
+        raise NotImplementedError
+
+    def listFeatureClasses(self):
+        """:returns: The names of all feature classes in the workspace."""
+        raise NotImplementedError
+
+    def listFields(self, feature):
+        """:returns: Field objects with name, type and aliasName, starting with FID and Shape."""
+        raise NotImplementedError
+
+    def shapeType(self, feature):
+        """:returns: "Point", "Polyline" or "Polygon"."""
+        raise NotImplementedError
+
+    def addFieldDelimiters(self, feature, field):
+        raise NotImplementedError
+
+    # Cursors, same arguments as arcpy.da
+    def searchCursor(self, feature, fields, sql_clause=None):
+        raise NotImplementedError
+
+    def updateCursor(self, feature, fields, sql_clause=None):
+        raise NotImplementedError
+
+    def featureClassToNumPyArray(self, feature, fields):
+        """:returns: A structured NumPy array with one column per field."""
+        raise NotImplementedError
+
+    def lineVertices(self, feature):
+        """Reads the vertices of a line feature class in one pass.
+
+        :returns: A list of (FID, parts) per line, every part is a list of (x, y, z) tuples.
+        """
+        raise NotImplementedError
+
+    def updateLineZ(self, feature, zValues):
+        """Replaces the Z values of line vertices in one pass, everything else is kept.
+
+        :param dict zValues: {FID: [[Z per vertex] per part]}, lines that aren't listed stay unchanged.
+        """
+        raise NotImplementedError
+
+    def adjustPointZ(self, feature, differences):
+        """Adds differences to the Z values of points like adjust3DZ and sets their POINT_Z field (if it exists)
+        to the new Z values, in one pass. Only the listed points are written.
+
+        :param dict differences: {FID: Z difference}, points that aren't listed stay unchanged.
+        """
+        raise NotImplementedError
+
+    # Geoprocessing tools
+    def copyFeatures(self, input, output):
+        raise NotImplementedError
+
+    def featureVerticesToPoints(self, input, output):
+        """Creates a point for every vertex of input, with the attributes of its line and its line FID as ORIG_FID."""
+        raise NotImplementedError
+
+    def addGeometryAttributes(self, feature):
+        """Adds or overwrites the fields POINT_X, POINT_Y, POINT_Z and POINT_M of a point feature class."""
+        raise NotImplementedError
+
+    def addField(self, feature, field, type):
+        raise NotImplementedError
+
+    def calculateField(self, feature, field, expression):
+        """Sets a field from an expression referencing other fields as [FIELD]."""
+        raise NotImplementedError
+
+    def deleteField(self, feature, field):
+        raise NotImplementedError
+
+    def addIndex(self, feature, fields):
+        """Indexes a feature class within a container by attribute fields, e.g. to sort by them."""
+        raise NotImplementedError
+
+    def adjust3DZ(self, feature, field):
+        """Adds the value of field to the Z values of every feature."""
+        raise NotImplementedError
+
+    def pointsToLine(self, input, output, lineField, sortField):
+        """Creates one line per value of lineField from the points of input, ordered by sortField."""
+        raise NotImplementedError
+
+class ArcpyBackend(Backend):
+    """Runs everything through arcpy."""
+    name = "arcpy"
+
+    def __init__(self):
+        import arcpy
+        self.arcpy = arcpy
+
+    @property
+    def workspace(self):
+        return self.arcpy.env.workspace
+
+    def setWorkspace(self, path):
+        self.arcpy.env.workspace = path
+        self.arcpy.env.overwriteOutput = True
+
+    def memoryPath(self, name):
+        # ArcGIS Pro has the faster "memory" workspace, ArcMap only knows "in_memory"
+        if self.arcpy.GetInstallInfo()["ProductName"] == "ArcGISPro":
+            return "memory\\" + name
+        return "in_memory\\" + name
+
+    def createContainer(self, path):
+        if self.arcpy.Exists(path):
+            return
+        if path.lower().endswith(".gdb"):
+            self.arcpy.CreateFileGDB_management(os.path.dirname(path), os.path.basename(path))
+        else:
+            self.arcpy.CreateSQLiteDatabase_management(path, "GEOPACKAGE")
+
+    def releaseFeatures(self):
+        self.arcpy.Delete_management(self.memoryPath("").rstrip("\\"))
+        self.arcpy.ClearWorkspaceCache_management()
+
+    def getParameterAsText(self, index):
+        return self.arcpy.GetParameterAsText(index)
+
+    def getParameter(self, index):
+        return self.arcpy.GetParameter(index)
+
+    def addMessage(self, message):
+        self.arcpy.AddMessage(message)
+
+    def setProgressor(self, type, label, minimum=0, maximum=100):
+        self.arcpy.SetProgressor(type, label, minimum, maximum)
+
+    def setProgressorLabel(self, label):
+        self.arcpy.SetProgressorLabel(label)
+
+    def setProgressorPosition(self, position=None):
+        if position is not None:
+            self.arcpy.SetProgressorPosition(position)
+        else:
+            self.arcpy.SetProgressorPosition()
+
+    def exists(self, feature):
+        return self.arcpy.Exists(feature)
+
+    def oidField(self, feature):
+        return self.arcpy.Describe(feature).OIDFieldName
+
+    def listFeatureClasses(self):
+        return self.arcpy.ListFeatureClasses()
+
+    def listFields(self, feature):
+        return self.arcpy.ListFields(feature)
+
+    def shapeType(self, feature):
+        return self.arcpy.Describe(feature).shapeType
+
+    def addFieldDelimiters(self, feature, field):
+        return self.arcpy.AddFieldDelimiters(feature, field)
+
+    def searchCursor(self, feature, fields, sql_clause=None):
+        return self.arcpy.da.SearchCursor(feature, fields, sql_clause=sql_clause)
+
+    def updateCursor(self, feature, fields, sql_clause=None):
+        return self.arcpy.da.UpdateCursor(feature, fields, sql_clause=sql_clause)
+
+    def featureClassToNumPyArray(self, feature, fields):
+        return self.arcpy.da.FeatureClassToNumPyArray(feature, fields)
+
+    def lineVertices(self, feature):
+        lines = []
+        with self.arcpy.da.SearchCursor(feature, ["OID@", "SHAPE@"]) as cursor:
+            for fid, shape in cursor:
+                parts = []
+                if shape:
+                    for part in shape:
+                        parts.append([(point.X, point.Y, point.Z) for point in part if point])
+                lines.append((fid, parts))
+        return lines
+
+    def updateLineZ(self, feature, zValues):
+        with self.arcpy.da.UpdateCursor(feature, ["OID@", "SHAPE@"]) as cursor:
+            for fid, shape in cursor:
+                if fid not in zValues or not shape:
+                    continue
+                parts = self.arcpy.Array()
+                for part, partZ in zip(shape, zValues[fid]):
+                    points = self.arcpy.Array()
+                    for point, z in zip([point for point in part if point], partZ):
+                        points.add(self.arcpy.Point(point.X, point.Y, z, point.M, point.ID))
+                    parts.add(points)
+                cursor.updateRow([fid, self.arcpy.Polyline(parts, shape.spatialReference, True, shape.hasM)])
+
+    def adjustPointZ(self, feature, differences):
+        if not differences:
+            return
+        fields = ["OID@", "SHAPE@"]
+        if "point_z" in [field.name.lower() for field in self.arcpy.ListFields(feature)]:
+            fields.append("POINT_Z")
+        # Only the FID range of the changed points is read, e.g. the points of one streamed batch
+        oidField = self.arcpy.AddFieldDelimiters(feature, self.oidField(feature))
+        where = "{0} >= {1} AND {0} <= {2}".format(oidField, min(differences), max(differences))
+        with self.arcpy.da.UpdateCursor(feature, fields, where) as cursor:
+            for row in cursor:
+                if row[0] not in differences or not row[1]:
+                    continue
+                point = row[1].firstPoint
+                z = point.Z + differences[row[0]]
+                row[1] = self.arcpy.PointGeometry(self.arcpy.Point(point.X, point.Y, z, point.M, point.ID), row[1].spatialReference, True, row[1].hasM)
+                if len(row) > 2:
+                    row[2] = z
+                cursor.updateRow(row)
+
+    def copyFeatures(self, input, output):
+        self.arcpy.CopyFeatures_management(input, output)
+
+    def featureVerticesToPoints(self, input, output):
+        self.arcpy.FeatureVerticesToPoints_management(input, output, "ALL")
+
+    def addGeometryAttributes(self, feature):
+        self.arcpy.AddGeometryAttributes_management(feature, "POINT_X_Y_Z_M")
+
+    def addField(self, feature, field, type):
+        self.arcpy.AddField_management(feature, field, type)
+
+    def calculateField(self, feature, field, expression):
+        self.arcpy.CalculateField_management(feature, field, expression)
+
+    def deleteField(self, feature, field):
+        self.arcpy.DeleteField_management(feature, field)
+
+    def addIndex(self, feature, fields):
+        # Index names have to be unique within a GeoPackage
+        self.arcpy.AddIndex_management(feature, fields, "{0}_{1}_idx".format(os.path.basename(feature), "_".join(fields)))
+
+    def adjust3DZ(self, feature, field):
+        self.arcpy.Adjust3DZ_management(feature, "NO_REVERSE", field)
+
+    def pointsToLine(self, input, output, lineField, sortField):
+        self.arcpy.PointsToLine_management(input, output, lineField, sortField)
+
+def getBackend(name=None):
+    """**Creates the geoprocessing backend.**
+
+    :param string name: [optional] "arcpy" or "local". Defaults to the SUBVISION_BACKEND environment variable,
+        otherwise arcpy if it can be imported and local if not.
+    :returns: Backend
+    """
+    name = name or os.environ.get("SUBVISION_BACKEND")
+    if not name:
+        try:
+            import arcpy
+            name = "arcpy"
+        except ImportError:
+            name = "local"
+
+    if name == "arcpy":
+        return ArcpyBackend()
+    if name == "local":
+        from subvision.localbackend import LocalBackend
+        return LocalBackend()
+    raise ValueError('Unknown backend "{0}", use "arcpy" or "local".'.format(name))
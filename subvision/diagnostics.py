@@ -0,0 +1,78 @@
+# Warnings of the SubVision scripts.
+#
+# A message per affected point makes runs on bad data slow and the message pane unreadable. Warnings are
+# therefore collected by category together with the IDs of the affected features. Only a summary per category is
+# printed, the single warnings are written to a CSV file.
+
+import os
+
+# Descriptions of the warning categories, as shown to the user
+CATEGORIES = {
+    "missingReference": "Start- oder Endpunkt der Linie in Referenz nicht gefunden",
+    "sameReference": "Start- und Endpunkt der Linie am selben Referenzpunkt, Linie nicht interpoliert",
+}
+
+class WarningCollector:
+    """**Collects warnings by category** with the FID and ORIG_FID of every affected feature."""
+    def __init__(self):
+        self.entries = [] # Stores (category, feature, FIDs, ORIG_FIDs) per add call
+
+    def add(self, category, feature, fids, lineIDs):
+        """Adds a warning for every feature of fids.
+
+        :param string category: The category, a key of CATEGORIES.
+        :param string feature: The feature class the features belong to.
+        :param list fids: The FIDs of the features, None where they aren't known (e.g. line vertices).
+        :param list lineIDs: The FIDs of the input lines of the features (ORIG_FID), in the same order.
+        :returns: void
+        """
+        if category not in CATEGORIES:
+            raise ValueError('Unknown warning category "{0}".'.format(category))
+        if len(lineIDs):
+            self.entries.append((category, feature, [None if fid is None else int(fid) for fid in fids],
+                                 [int(lineID) for lineID in lineIDs]))
+
+    def counts(self):
+        """:returns: {category: number of warnings}"""
+        counts = {}
+        for category, feature, fids, lineIDs in self.entries:
+            counts[category] = counts.get(category, 0) + len(lineIDs)
+        return counts
+
+    def take(self):
+        """Removes all warnings and returns them, e.g. to send them from a worker process to the script process.
+
+        :returns: list of entries for extend.
+        """
+        entries = self.entries
+        self.entries = []
+        return entries
+
+    def extend(self, entries):
+        """Adds the warnings returned by take of another collector."""
+        self.entries.extend(entries)
+
+    def summary(self):
+        """:returns: One message per category with the number of affected features and lines."""
+        counts = self.counts()
+        messages = []
+        for category in sorted(counts):
+            lines = set()
+            for entryCategory, feature, fids, lineIDs in self.entries:
+                if entryCategory == category:
+                    lines.update((feature, lineID) for lineID in lineIDs)
+            messages.append("Warnung: {0} ({1} Punkte in {2} Linien)".format(CATEGORIES[category], counts[category], len(lines)))
+        return messages
+
+    def writeCSV(self, path):
+        """**Writes all warnings** as CSV with one line per affected feature, separated by semicolons.
+
+        :param string path: The path of the CSV file.
+        :returns: void
+        """
+        with open(path, "w") as file:
+            file.write("Kategorie;Beschreibung;Feature;FID;ORIG_FID\n")
+            for category, feature, fids, lineIDs in self.entries:
+                for fid, lineID in zip(fids, lineIDs):
+                    file.write("{0};{1};{2};{3};{4}\n".format(category, CATEGORIES[category], os.path.basename(feature),
+                                                             "" if fid is None else fid, lineID))
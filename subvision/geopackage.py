@@ -0,0 +1,470 @@
+# Reading and writing of feature classes in a GeoPackage (.gpkg) in plain Python, used by the local backend.
+#
+# A GeoPackage is a SQLite database, so all intermediates and results of a run fit into one file. Features are
+# inserted in bulk within one transaction, single columns and rows can be changed without rewriting the table and
+# the tables can be indexed by attributes (e.g. ORIG_FID). R-trees of tables created by other programs are kept.
+# Only point and polyline feature classes are supported, M values are not stored. Like in shapefiles,
+# FIDs are the positions of the features starting at 0, the tables written here store them as fid.
+
+import re
+import struct
+import sqlite3
+import datetime
+import contextlib
+
+from subvision.shapefiles import Field, FeatureClass, shapeTypeCode, shapeVertices
+
+APPLICATION_ID = 0x47504B47 # "GPKG"
+USER_VERSION = 10200 # GeoPackage 1.2
+GEOMETRY_COLUMN = "geom"
+
+# Column types per field type and back, named like in the GeoPackage standard
+COLUMN_TYPES = {"String": "TEXT({0})", "Double": "DOUBLE", "Integer": "MEDIUMINT", "SmallInteger": "SMALLINT", "Date": "DATE"}
+FIELD_TYPES = {"TEXT": "String", "DOUBLE": "Double", "REAL": "Double", "FLOAT": "Double", "MEDIUMINT": "Integer", "INTEGER": "Integer",
+               "INT": "Integer", "TINYINT": "SmallInteger", "SMALLINT": "SmallInteger", "BOOLEAN": "SmallInteger", "DATE": "Date", "DATETIME": "Date"}
+
+# WKB geometry types without Z, the ISO types with Z add 1000
+WKB_POINT = 1
+WKB_LINESTRING = 2
+WKB_MULTILINESTRING = 5
+
+VERSION_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+METADATA = [
+    """CREATE TABLE IF NOT EXISTS gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER NOT NULL PRIMARY KEY,
+        organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT)""",
+    """CREATE TABLE IF NOT EXISTS gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE,
+        description TEXT DEFAULT '', last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+        min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER,
+        CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id))""",
+    """CREATE TABLE IF NOT EXISTS gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL,
+        geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+        CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name), CONSTRAINT uk_gc_table_name UNIQUE (table_name),
+        CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name),
+        CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys (srs_id))""",
+    """CREATE TABLE IF NOT EXISTS gpkg_extensions (table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL,
+        definition TEXT NOT NULL, scope TEXT NOT NULL, CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name))""",
+]
+SPATIAL_REFERENCES = [
+    ("WGS 84 geodetic", 4326, "EPSG", 4326, 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],'
+     'AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],'
+     'AUTHORITY["EPSG","4326"]]', "longitude/latitude coordinates in decimal degrees on the WGS 84 spheroid"),
+    ("Undefined cartesian SRS", -1, "NONE", -1, "undefined", "undefined cartesian coordinate reference system"),
+    ("Undefined geographic SRS", 0, "NONE", 0, "undefined", "undefined geographic coordinate reference system"),
+]
+
+# Triggers that keep the R-tree of a table up to date, as defined by the GeoPackage standard (F.3)
+RTREE_TRIGGERS = [
+    """CREATE TRIGGER "rtree_{t}_{c}_insert" AFTER INSERT ON "{t}" WHEN (new."{c}" NOT NULL AND NOT ST_IsEmpty(NEW."{c}"))
+        BEGIN INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (NEW."{i}", ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"), ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}")); END""",
+    """CREATE TRIGGER "rtree_{t}_{c}_update1" AFTER UPDATE OF "{c}" ON "{t}"
+        WHEN OLD."{i}" = NEW."{i}" AND (NEW."{c}" NOTNULL AND NOT ST_IsEmpty(NEW."{c}"))
+        BEGIN INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (NEW."{i}", ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"), ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}")); END""",
+    """CREATE TRIGGER "rtree_{t}_{c}_update2" AFTER UPDATE OF "{c}" ON "{t}"
+        WHEN OLD."{i}" = NEW."{i}" AND (NEW."{c}" IS NULL OR ST_IsEmpty(NEW."{c}"))
+        BEGIN DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."{i}"; END""",
+    """CREATE TRIGGER "rtree_{t}_{c}_update3" AFTER UPDATE ON "{t}"
+        WHEN OLD."{i}" != NEW."{i}" AND (NEW."{c}" NOTNULL AND NOT ST_IsEmpty(NEW."{c}"))
+        BEGIN DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."{i}";
+        INSERT OR REPLACE INTO "rtree_{t}_{c}" VALUES (NEW."{i}", ST_MinX(NEW."{c}"), ST_MaxX(NEW."{c}"), ST_MinY(NEW."{c}"), ST_MaxY(NEW."{c}")); END""",
+    """CREATE TRIGGER "rtree_{t}_{c}_update4" AFTER UPDATE ON "{t}"
+        WHEN OLD."{i}" != NEW."{i}" AND (NEW."{c}" IS NULL OR ST_IsEmpty(NEW."{c}"))
+        BEGIN DELETE FROM "rtree_{t}_{c}" WHERE id IN (OLD."{i}", NEW."{i}"); END""",
+    """CREATE TRIGGER "rtree_{t}_{c}_delete" AFTER DELETE ON "{t}" WHEN old."{c}" NOT NULL
+        BEGIN DELETE FROM "rtree_{t}_{c}" WHERE id = OLD."{i}"; END""",
+]
+
+def quote(name):
+    """Quotes a table or column name for SQL."""
+    return '"{0}"'.format(name.replace('"', '""'))
+
+# ---------------------------------------------------------------------------------------- #
+# Connections
+
+def connect(path):
+    """Opens a GeoPackage. Transactions are started explicitly, see transaction.
+    The geometry functions of the R-tree triggers are defined for the connection.
+    """
+    connection = sqlite3.connect(path, timeout=60, isolation_level=None) # Worker processes may write other tables at the same time
+    connection.create_function("ST_IsEmpty", 1, lambda blob: None if blob is None else int(geometryIsEmpty(blob)))
+    for index, name in enumerate(("ST_MinX", "ST_MaxX", "ST_MinY", "ST_MaxY")):
+        connection.create_function(name, 1, lambda blob, index=index: None if blob is None else geometryEnvelope(blob)[index])
+    return connection
+
+@contextlib.contextmanager
+def transaction(path, write=True):
+    """Runs the statements of a with block in one transaction, everything is rolled back on errors.
+
+    :param string path: The path of the GeoPackage.
+    :param bool write: [optional] False to only read, other connections can read and write in the meantime.
+    """
+    connection = connect(path)
+    try:
+        connection.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        yield connection
+        connection.execute("COMMIT")
+    finally:
+        connection.close() # Rolls back if the transaction wasn't committed
+
+def createGeoPackage(path):
+    """**Creates an empty GeoPackage** with the required metadata tables, an existing one is kept.
+
+    :param string path: The path of the .gpkg file.
+    :returns: void
+    """
+    with transaction(path) as connection:
+        connection.execute("PRAGMA application_id = {0}".format(APPLICATION_ID))
+        connection.execute("PRAGMA user_version = {0}".format(USER_VERSION))
+        for statement in METADATA:
+            connection.execute(statement)
+        connection.executemany("INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)", SPATIAL_REFERENCES)
+
+def listTables(path):
+    """:returns: The names of the feature tables of a GeoPackage."""
+    with contextlib.closing(connect(path)) as connection:
+        return [name for name, in connection.execute("SELECT table_name FROM gpkg_contents WHERE data_type = 'features' ORDER BY table_name")]
+
+def tableVersion(path, table):
+    """Identifies the version of a feature table, another process (see subvision/pipeline.py) may have written it.
+
+    :returns: The last change of the table as string, None if it doesn't exist.
+    """
+    with contextlib.closing(connect(path)) as connection:
+        row = connection.execute("SELECT last_change FROM gpkg_contents WHERE table_name = ?", (table,)).fetchone()
+    return row[0] if row else None
+
+def touch(connection, table, previous=None):
+    """Sets the last change of a table to now. The new version is always later than the previous one,
+    even if the clock didn't move on since the last change.
+
+    :param string previous: [optional] The last change before the table was recreated.
+    """
+    if previous is None:
+        row = connection.execute("SELECT last_change FROM gpkg_contents WHERE table_name = ?", (table,)).fetchone()
+        previous = row[0] if row else None
+    now = datetime.datetime.utcnow()
+    try:
+        now = max(now, datetime.datetime.strptime(previous, VERSION_FORMAT) + datetime.timedelta(milliseconds=1))
+    except (TypeError, ValueError):
+        pass # No or a foreign previous version
+    connection.execute("UPDATE gpkg_contents SET last_change = ? WHERE table_name = ?", (now.strftime(VERSION_FORMAT)[:-4] + "Z", table))
+
+def hasPositionalFIDs(connection, table):
+    """Whether the fid (rowid) of every feature is its position starting at 0, as in the tables written by writeTable.
+    Rows of other tables can't be addressed by FID."""
+    first, last, count = connection.execute("SELECT MIN(rowid), MAX(rowid), COUNT(*) FROM {0}".format(quote(table))).fetchone()
+    return count == 0 or (first == 0 and last == count - 1)
+
+# ---------------------------------------------------------------------------------------- #
+# Geometries, stored as GeoPackage binary: a short header with the spatial reference and the envelope, then WKB
+
+def packGeometry(shape, geometryType, hasZ, srsID):
+    if shape is None:
+        return None
+    if geometryType == "Point":
+        x, y, z, m = shape
+        wkb = struct.pack("<BI3d", 1, WKB_POINT + 1000, x, y, z) if hasZ else struct.pack("<BI2d", 1, WKB_POINT, x, y)
+        return b"GP" + struct.pack("<BBi", 0, 1, srsID) + wkb # Little endian, no envelope
+
+    vertexFormat = "<3d" if hasZ else "<2d"
+    wkb = [struct.pack("<BII", 1, WKB_MULTILINESTRING + (1000 if hasZ else 0), len(shape))]
+    for part in shape:
+        wkb.append(struct.pack("<BII", 1, WKB_LINESTRING + (1000 if hasZ else 0), len(part)))
+        wkb.extend(struct.pack(vertexFormat, *vertex[:3 if hasZ else 2]) for vertex in part)
+    vertices = shapeVertices(shape)
+    if not vertices:
+        return b"GP" + struct.pack("<BBi", 0, 0x11, srsID) + b"".join(wkb) # Empty
+    xs = [vertex[0] for vertex in vertices]
+    ys = [vertex[1] for vertex in vertices]
+    envelope = struct.pack("<4d", min(xs), max(xs), min(ys), max(ys))
+    return b"GP" + struct.pack("<BBi", 0, 3, srsID) + envelope + b"".join(wkb)
+
+def geometryBody(blob):
+    """:returns: The flags of a GeoPackage geometry and the offset of its WKB."""
+    blob = bytes(blob)
+    if blob[:2] != b"GP":
+        raise ValueError("No GeoPackage geometry.")
+    flags = bytearray(blob[3:4])[0]
+    envelopeSize = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}[(flags >> 1) & 7]
+    return flags, 8 + envelopeSize
+
+def geometryIsEmpty(blob):
+    flags, offset = geometryBody(blob)
+    return bool(flags & 0x10)
+
+def geometryEnvelope(blob):
+    """:returns: minimum X, maximum X, minimum Y and maximum Y of a geometry, from its header if it has an envelope."""
+    flags, offset = geometryBody(blob)
+    if offset > 8:
+        return struct.unpack("<4d" if flags & 1 else ">4d", bytes(blob)[8:40])
+    vertices = shapeVertices(readWKB(bytes(blob), offset)[0])
+    xs = [vertex[0] for vertex in vertices]
+    ys = [vertex[1] for vertex in vertices]
+    return min(xs), max(xs), min(ys), max(ys)
+
+def unpackGeometry(blob, geometryType):
+    if blob is None:
+        return None
+    flags, offset = geometryBody(blob)
+    shape = readWKB(bytes(blob), offset)[0]
+    if geometryType == "Point":
+        return shape if isinstance(shape, tuple) else None
+    return shape if isinstance(shape, list) else [shape]
+
+def readWKB(data, offset):
+    """Reads a point, linestring or multilinestring with or without Z.
+
+    :returns: The shape (a (x, y, z, m) tuple or a list of parts) and the offset after it.
+    """
+    order = "<" if bytearray(data[offset:offset + 1])[0] == 1 else ">"
+    code, = struct.unpack(order + "I", data[offset + 1:offset + 5])
+    offset += 5
+    dimensions = (code & 0x0FFFFFFF) // 1000 # ISO types, 1 with Z, 2 with M, 3 with both
+    hasZ = dimensions in (1, 3) or bool(code & 0x80000000) # Or the flags of extended WKB
+    hasM = dimensions in (2, 3) or bool(code & 0x40000000)
+    baseCode = (code & 0x0FFFFFFF) % 1000
+    size = 2 + hasZ + hasM
+
+    def vertex(offset):
+        values = struct.unpack(order + "{0}d".format(size), data[offset:offset + 8 * size])
+        return (values[0], values[1], values[2] if hasZ else 0.0, None)
+
+    if baseCode == WKB_POINT:
+        return vertex(offset), offset + 8 * size
+    count, = struct.unpack(order + "I", data[offset:offset + 4])
+    offset += 4
+    if baseCode == WKB_LINESTRING:
+        return [vertex(offset + 8 * size * index) for index in range(count)], offset + 8 * size * count
+    if baseCode == WKB_MULTILINESTRING:
+        parts = []
+        for index in range(count):
+            part, offset = readWKB(data, offset)
+            parts.append(part)
+        return parts, offset
+    raise ValueError("WKB geometry type {0} is not supported.".format(code))
+
+# ---------------------------------------------------------------------------------------- #
+# Reading
+
+def readTable(path, table):
+    """Reads a feature table of a GeoPackage into memory.
+
+    :param string path: The path of the .gpkg file.
+    :param string table: The name of the feature table.
+    :returns: FeatureClass
+    """
+    with transaction(path, False) as connection:
+        row = connection.execute("SELECT column_name, geometry_type_name, z, srs_id FROM gpkg_geometry_columns WHERE table_name = ?", (table,)).fetchone()
+        if row is None:
+            raise ValueError("{0} is no feature table of {1}.".format(table, path))
+        geometryColumn, geometryTypeName, hasZ, srsID = row
+        geometryType = {"POINT": "Point", "LINESTRING": "Polyline", "MULTILINESTRING": "Polyline"}.get(geometryTypeName.upper())
+        if geometryType is None:
+            raise ValueError("Geometry type {0} of {1} is not supported.".format(geometryTypeName, table))
+        definition = connection.execute("SELECT definition FROM gpkg_spatial_ref_sys WHERE srs_id = ?", (srsID,)).fetchone()
+        projection = definition[0] if definition and definition[0] != "undefined" else None
+
+        fidColumn = None
+        fields = []
+        for cid, name, columnType, notNull, default, primaryKey in connection.execute("PRAGMA table_info({0})".format(quote(table))):
+            if primaryKey:
+                fidColumn = name
+            elif name != geometryColumn:
+                match = re.match(r"(\w+)\s*(?:\((\d+)\))?", columnType.upper())
+                fieldType = FIELD_TYPES.get(match.group(1) if match else "", "String")
+                fields.append(Field(name, fieldType, int(match.group(2)) if fieldType == "String" and match.group(2) else None))
+
+        featureClass = FeatureClass(shapeTypeCode(geometryType, bool(hasZ)), fields, projection)
+        columns = ", ".join(quote(name) for name in [geometryColumn] + [field.name for field in fields])
+        dates = [index for index, field in enumerate(fields) if field.type == "Date"]
+        for row in connection.execute("SELECT {0} FROM {1} ORDER BY {2}".format(columns, quote(table), quote(fidColumn))):
+            record = list(row[1:])
+            for index in dates:
+                if record[index]:
+                    record[index] = datetime.datetime.strptime(record[index][:10], "%Y-%m-%d")
+            featureClass.shapes.append(unpackGeometry(row[0], geometryType))
+            featureClass.records.append(record)
+    return featureClass
+
+def orderedFIDs(path, table, orderBy):
+    """**Sorts the features of a table in SQLite**, which uses the indexes of the table (see createIndex).
+    Features with the same values keep their FID order.
+
+    :param string path: The path of the .gpkg file.
+    :param string table: The name of the feature table.
+    :param list orderBy: (field, descending) per sort key, FID or OID@ sort by FID.
+    :returns: The FIDs in sorted order, None if the FIDs of the table aren't positional (see hasPositionalFIDs).
+    """
+    terms = []
+    for name, descending in orderBy:
+        column = "rowid" if name.upper() in ("FID", "OID@") else quote(name)
+        terms.append(column + (" DESC" if descending else ""))
+    terms.append("rowid")
+    with transaction(path, False) as connection:
+        if not hasPositionalFIDs(connection, table):
+            return None
+        return [fid for fid, in connection.execute("SELECT rowid FROM {0} ORDER BY {1}".format(quote(table), ", ".join(terms)))]
+
+# ---------------------------------------------------------------------------------------- #
+# Writing
+
+def spatialReference(connection, projection):
+    """:returns: The srs_id of a projection (WKT), added to the GeoPackage if it is new. -1 without projection."""
+    if not projection:
+        return -1
+    row = connection.execute("SELECT srs_id FROM gpkg_spatial_ref_sys WHERE definition = ?", (projection,)).fetchone()
+    if row:
+        return row[0]
+    srsID = max(100000, connection.execute("SELECT MAX(srs_id) FROM gpkg_spatial_ref_sys").fetchone()[0] + 1)
+    match = re.match(r'\s*\w+\["([^"]*)"', projection)
+    connection.execute("INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, 'NONE', ?, ?, NULL)", (match.group(1) if match else "Unknown", srsID, srsID, projection))
+    return srsID
+
+def dropTable(connection, table):
+    """Deletes a feature table with its indexes, its R-tree and its metadata."""
+    connection.execute("DROP TABLE IF EXISTS {0}".format(quote("rtree_{0}_{1}".format(table, GEOMETRY_COLUMN))))
+    connection.execute("DROP TABLE IF EXISTS {0}".format(quote(table)))
+    for metadata in ("gpkg_extensions", "gpkg_geometry_columns", "gpkg_contents"):
+        connection.execute("DELETE FROM {0} WHERE table_name = ?".format(metadata), (table,))
+
+def columnValue(value, field):
+    if value is not None and field.type == "Date":
+        return value.strftime("%Y-%m-%d")
+    return value
+
+def writeTable(path, table, featureClass):
+    """**Writes a feature class as table of a GeoPackage** in one transaction, an existing table is replaced.
+    The attribute indexes and the R-tree of a replaced table are created again.
+
+    :param string path: The path of the .gpkg file, see createGeoPackage.
+    :param string table: The name of the feature table.
+    :param FeatureClass featureClass: The features to write.
+    :returns: void
+    """
+    geometryType = featureClass.geometryType
+    if geometryType not in ("Point", "Polyline"):
+        raise ValueError("{0} feature classes can't be written to a GeoPackage.".format(geometryType))
+    hasZ = featureClass.hasZ
+
+    with transaction(path) as connection:
+        indexes = [sql for sql, in connection.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql NOT NULL", (table,))]
+        spatialIndex = connection.execute("SELECT 1 FROM gpkg_extensions WHERE table_name = ? AND extension_name = 'gpkg_rtree_index'", (table,)).fetchone()
+        row = connection.execute("SELECT last_change FROM gpkg_contents WHERE table_name = ?", (table,)).fetchone()
+        dropTable(connection, table)
+
+        srsID = spatialReference(connection, featureClass.projection)
+        columns = ["fid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL", "{0} {1}".format(GEOMETRY_COLUMN, "POINT" if geometryType == "Point" else "MULTILINESTRING")]
+        columns.extend("{0} {1}".format(quote(field.name), COLUMN_TYPES[field.type].format(field.length)) for field in featureClass.fields)
+        connection.execute("CREATE TABLE {0} ({1})".format(quote(table), ", ".join(columns)))
+
+        vertices = [vertex for shape in featureClass.shapes for vertex in shapeVertices(shape)]
+        bounds = (min(v[0] for v in vertices), min(v[1] for v in vertices), max(v[0] for v in vertices), max(v[1] for v in vertices)) if vertices else (None,) * 4
+        connection.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier, min_x, min_y, max_x, max_y, srs_id) VALUES (?, 'features', ?, ?, ?, ?, ?, ?)",
+                           (table, table) + bounds + (srsID,))
+        connection.execute("INSERT INTO gpkg_geometry_columns VALUES (?, ?, ?, ?, ?, 0)",
+                           (table, GEOMETRY_COLUMN, "POINT" if geometryType == "Point" else "MULTILINESTRING", srsID, int(hasZ)))
+        touch(connection, table, row[0] if row else None)
+
+        connection.executemany("INSERT INTO {0} VALUES ({1})".format(quote(table), ", ".join(["?"] * (len(featureClass.fields) + 2))),
+                               ([fid, packGeometry(shape, geometryType, hasZ, srsID)] + [columnValue(value, field) for value, field in zip(record, featureClass.fields)]
+                                for fid, (record, shape) in enumerate(zip(featureClass.records, featureClass.shapes))))
+        for sql in indexes:
+            try:
+                connection.execute(sql)
+            except sqlite3.OperationalError:
+                pass # The indexed field was deleted
+        if spatialIndex:
+            addSpatialIndex(connection, table)
+
+def updateColumn(path, table, field, values):
+    """**Writes the values of one column**, e.g. after a field calculation, without rewriting the table.
+
+    :param string path: The path of the .gpkg file.
+    :param string table: The name of the feature table.
+    :param Field field: The field of the column.
+    :param list values: The value of every feature, in FID order.
+    :returns: False if the rows can't be addressed by FID, see hasPositionalFIDs. Nothing is written then.
+    """
+    with transaction(path) as connection:
+        if not hasPositionalFIDs(connection, table):
+            return False
+        connection.executemany("UPDATE {0} SET {1} = ? WHERE rowid = ?".format(quote(table), quote(field.name)),
+                               ((columnValue(value, field), fid) for fid, value in enumerate(values)))
+        touch(connection, table)
+    return True
+
+def updatePointZ(path, table, featureClass, fids, zField=None):
+    """**Writes changed Z values of point features** into their rows, like patchPointZ does for shapefiles.
+    featureClass has to be the content of the table, with the shapes (and zField values) at fids already changed.
+
+    :param string path: The path of the .gpkg file.
+    :param string table: The name of the feature table.
+    :param FeatureClass featureClass: The features of the table.
+    :param list fids: The FIDs of the changed features.
+    :param string zField: [optional] The name of a field storing the Z values, e.g. POINT_Z, written as well.
+    :returns: False if the rows can't be addressed by FID, see hasPositionalFIDs. Nothing is written then.
+    """
+    if featureClass.geometryType != "Point" or not featureClass.hasZ:
+        return False
+    fieldIndex = featureClass.fieldIndex(zField) if zField else None
+    with transaction(path) as connection:
+        if not hasPositionalFIDs(connection, table):
+            return False
+        srsID = spatialReference(connection, featureClass.projection)
+        assignments = "{0} = ?".format(GEOMETRY_COLUMN) + (", {0} = ?".format(quote(featureClass.fields[fieldIndex].name)) if fieldIndex is not None else "")
+        rows = []
+        for fid in fids:
+            row = [packGeometry(featureClass.shapes[fid], "Point", True, srsID)]
+            if fieldIndex is not None:
+                row.append(featureClass.records[fid][fieldIndex])
+            rows.append(row + [fid])
+        connection.executemany("UPDATE {0} SET {1} WHERE rowid = ?".format(quote(table), assignments), rows)
+        touch(connection, table)
+    return True
+
+def addColumn(path, table, field):
+    """Adds an empty column for a field without rewriting the table.
+
+    :returns: void
+    """
+    with transaction(path) as connection:
+        connection.execute("ALTER TABLE {0} ADD COLUMN {1} {2}".format(quote(table), quote(field.name), COLUMN_TYPES[field.type].format(field.length)))
+        touch(connection, table)
+
+def dropColumn(path, table, field):
+    """Deletes the column of a field without rewriting the table.
+
+    :returns: False if SQLite can't drop the column, e.g. because it is older than 3.35 or the column is indexed.
+    """
+    try:
+        with transaction(path) as connection:
+            connection.execute("ALTER TABLE {0} DROP COLUMN {1}".format(quote(table), quote(field)))
+            touch(connection, table)
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+# ---------------------------------------------------------------------------------------- #
+# Indexes
+
+def createIndex(path, table, fields):
+    """**Indexes a table by attribute fields**, e.g. to sort by ORIG_FID. Kept when writeTable replaces the table.
+
+    :param string path: The path of the .gpkg file.
+    :param string table: The name of the feature table.
+    :param list fields: The names of the indexed fields.
+    :returns: void
+    """
+    name = "{0}_{1}_idx".format(table, "_".join(fields)) # Index names are unique within the whole GeoPackage
+    with transaction(path) as connection:
+        connection.execute("CREATE INDEX IF NOT EXISTS {0} ON {1} ({2})".format(quote(name), quote(table), ", ".join(quote(field) for field in fields)))
+
+def addSpatialIndex(connection, table):
+    rtree = quote("rtree_{0}_{1}".format(table, GEOMETRY_COLUMN))
+    connection.execute("CREATE VIRTUAL TABLE {0} USING rtree(id, minx, maxx, miny, maxy)".format(rtree))
+    connection.execute("INSERT INTO {0} SELECT fid, ST_MinX({1}), ST_MaxX({1}), ST_MinY({1}), ST_MaxY({1}) FROM {2} WHERE {1} NOT NULL AND NOT ST_IsEmpty({1})"
+                       .format(rtree, GEOMETRY_COLUMN, quote(table)))
+    for trigger in RTREE_TRIGGERS:
+        connection.execute(trigger.format(t=table.replace('"', '""'), c=GEOMETRY_COLUMN, i="fid"))
+    connection.execute("INSERT INTO gpkg_extensions VALUES (?, ?, 'gpkg_rtree_index', 'http://www.geopackage.org/spec120/#extension_rtree', 'write-only')",
+                       (table, GEOMETRY_COLUMN))
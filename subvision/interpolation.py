@@ -0,0 +1,507 @@
+# Z interpolation kernels of Kanalhaltungen-anpassen.py.
+#
+# The kernels work on plain coordinate lists/arrays and don't touch feature classes, so the script can run them on
+# points, line vertices or in worker processes. Lines are independent in interpolateZDifferences and connection
+# groups that aren't snapped to each other are independent in referenceZDifferences. With workers > 1 they are split
+# into partitions that run in a process pool, the results are merged back in the original point order.
+
+import os
+import sys
+import math
+import bisect
+import multiprocessing
+
+import numpy
+
+from subvision.progress import SilentProgress
+
+PARTITIONS_PER_WORKER = 4 # More partitions than workers balances uneven partitions
+MIN_PARTITION_POINTS = 5000 # Smaller inputs aren't worth starting processes for
+
+class PointGrid:
+    """**Spatial hash over 2D points** to find the nearest point within a tolerance without scanning all points.
+    Points are stored in square cells with the size of the tolerance, so a lookup only checks the 3x3 cells around it.
+    """
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self.cells = {}
+
+    def cellOf(self, x, y):
+        return (int(math.floor(x / self.tolerance)), int(math.floor(y / self.tolerance)))
+
+    def insert(self, x, y, item):
+        """Adds an item at the given position.
+
+        :param float x: X coordinate of the item.
+        :param float y: Y coordinate of the item.
+        :param item: The object to return on lookups.
+        """
+        self.cells.setdefault(self.cellOf(x, y), []).append((x, y, item))
+
+    def nearest(self, x, y):
+        """Finds the item closest to the given position.
+
+        :param float x: X coordinate to search at.
+        :param float y: Y coordinate to search at.
+        :returns: The nearest item within the tolerance, None if there is none. Ties go to the first inserted item.
+        """
+        cellX, cellY = self.cellOf(x, y)
+        nearestItem = None
+        nearestDistance = self.tolerance ** 2
+        for i in range(cellX - 1, cellX + 2):
+            for j in range(cellY - 1, cellY + 2):
+                for pointX, pointY, item in self.cells.get((i, j), ()):
+                    distance = (pointX - x) ** 2 + (pointY - y) ** 2
+                    if distance < nearestDistance or (nearestItem is None and distance == nearestDistance):
+                        nearestItem = item
+                        nearestDistance = distance
+        return nearestItem
+
+    def entriesNear(self, pointX, pointY):
+        """Collects the entries a worker needs to look up the given positions: those in the 3x3 cells around each position.
+        Entries keep their order within a cell, so a grid built from them finds the same nearest items.
+
+        :param list pointX: The X coordinates that will be searched at.
+        :param list pointY: The Y coordinates that will be searched at.
+        :returns: A list of (X, Y, item) entries, see fromEntries.
+        """
+        cells = set()
+        for x, y in zip(pointX, pointY):
+            cellX, cellY = self.cellOf(x, y)
+            for i in range(cellX - 1, cellX + 2):
+                for j in range(cellY - 1, cellY + 2):
+                    cells.add((i, j))
+        entries = []
+        for cell in sorted(cells):
+            entries.extend(self.cells.get(cell, ()))
+        return entries
+
+    @classmethod
+    def fromEntries(cls, tolerance, entries):
+        """Creates a grid from (X, Y, item) entries, see entriesNear."""
+        grid = cls(tolerance)
+        for x, y, item in entries:
+            grid.insert(x, y, item)
+        return grid
+    # -------------------------------------------------------------------------------------#
+
+class SnapGraph:
+    """**Connects values that lie within a tolerance of each other**, e.g. the XY-IDs of snapped points.
+    The values are sorted once, so the neighbours of a point are found by binary search instead of scanning all points.
+    """
+    def __init__(self, values, tolerance):
+        self.values = values
+        self.tolerance = tolerance
+        self.order = sorted(range(len(values)), key=lambda index: values[index])
+        self.sortedValues = [values[index] for index in self.order]
+        self.cache = {}
+
+    def neighbours(self, index):
+        """Finds all points whose value lies strictly within the tolerance of the value of the given point.
+
+        :param int index: The index of the point to search from.
+        :returns: The indexes of the connected points in ascending order, including the point itself.
+        """
+        if index not in self.cache:
+            value = self.values[index]
+            lower = bisect.bisect_right(self.sortedValues, value - self.tolerance)
+            upper = bisect.bisect_left(self.sortedValues, value + self.tolerance)
+            self.cache[index] = sorted(self.order[lower:upper])
+        return self.cache[index]
+
+    # -------------------------------------------------------------------------------------#
+
+def isSameReference(startX, startY, endX, endY):
+    """:returns: True if the reference points at the start and end of a line are at the same position. The line has no
+    base length to interpolate along then, e.g. a line that starts and ends at the same manhole."""
+    xLength = startX - endX
+    yLength = startY - endY
+    return (xLength * xLength) + (yLength * yLength) == 0
+
+def subInterpolatePoints(difsToOriginal, lineIDs, lengthsToStart, originalZs):
+    """Interpolates adjusted points between the previous and next non-adjusted point of their line.
+    Contiguous adjusted points of a line form a run, all points of a run are interpolated from the same two anchors at once.
+    Runs at the start or end of a line have no anchor on one side and stay as they are.
+
+    :param list difsToOriginal: The Z adjustment per point, 0 for non-adjusted points.
+    :param list lineIDs: The line ID per point. Points of a line have to be consecutive.
+    :param list lengthsToStart: The distance of each point to the start reference of its line.
+    :param list originalZs: The Z value of each point before adjustment.
+    :returns: The new Z adjustment per point as array and the number of sub-interpolated points.
+    """
+    difsToOriginal = numpy.asarray(difsToOriginal, dtype=float)
+    lineIDs = numpy.asarray(lineIDs)
+    lengthsToStart = numpy.asarray(lengthsToStart, dtype=float)
+    originalZs = numpy.asarray(originalZs, dtype=float)
+    subDifs = difsToOriginal.copy()
+    if len(subDifs) == 0:
+        return subDifs, 0
+
+    # Detect runs of adjusted points within lines
+    adjusted = difsToOriginal != 0
+    lineStart = numpy.r_[True, lineIDs[1:] != lineIDs[:-1]]
+    lineEnd = numpy.r_[lineStart[1:], True]
+    runStarts = numpy.flatnonzero(adjusted & (lineStart | ~numpy.r_[False, adjusted[:-1]]))
+    runEnds = numpy.flatnonzero(adjusted & (lineEnd | ~numpy.r_[adjusted[1:], False]))
+
+    # Anchors are the non-adjusted neighbours of a run, they have to be on the same line
+    anchored = ~lineStart[runStarts] & ~lineEnd[runEnds]
+    runStarts = runStarts[anchored]
+    runEnds = runEnds[anchored]
+    if len(runStarts) == 0:
+        return subDifs, 0
+
+    # Spread anchors to the points of their run
+    runLengths = runEnds - runStarts + 1
+    cIndexes = numpy.repeat(runEnds - runLengths.cumsum(), runLengths) + numpy.arange(runLengths.sum()) + 1
+    sIndexes = numpy.repeat(runStarts - 1, runLengths)
+    eIndexes = numpy.repeat(runEnds + 1, runLengths)
+
+    # Create new reference data
+    zDif = originalZs[eIndexes] - originalZs[sIndexes]
+    baseLength = lengthsToStart[eIndexes] - lengthsToStart[sIndexes]
+    toStartLength = lengthsToStart[cIndexes] - lengthsToStart[sIndexes]
+    interpolate = (toStartLength > 0) & (baseLength > 0)
+    cIndexes = cIndexes[interpolate]
+    sIndexes = sIndexes[interpolate]
+
+    distanceFactor = toStartLength[interpolate] / baseLength[interpolate]
+    newZ = originalZs[sIndexes] - (distanceFactor * zDif[interpolate])  # Calculate new Z coord based on distance to start point
+    difToOriginal = newZ - (originalZs[cIndexes] + difsToOriginal[cIndexes])
+    subDifs[cIndexes] += difToOriginal
+
+    return subDifs, len(cIndexes)
+
+# ---------------------------------------------------------------------------------------- #
+# Kernels
+
+def interpolateZDifferences(lineIDs, pointX, pointY, originalZs, refGrid, subInterpolate=False, progress=None, workers=1):
+    """**Calculates the Z adjustment of line points** between the reference points at the start and end of their line.
+
+    :param array lineIDs: The line ID per point. Points of a line have to be consecutive and in line order.
+    :param array pointX: The X coordinate per point.
+    :param array pointY: The Y coordinate per point.
+    :param array originalZs: The Z value per point.
+    :param PointGrid refGrid: The reference points with (X, Y, Z) tuples as items.
+    :param bool subInterpolate: [optional] Whether to interpolate adjusted points between non-adjusted ones afterwards.
+    :param ProgressReporter progress: [optional] Reports the line loop.
+    :param int workers: [optional] The number of processes to split the lines over, 0 uses all cores.
+    :returns: The Z adjustment per point as array, the number of adjusted points and the indexes of the points of skipped
+        lines as {warning category: array}: "missingReference" for lines without a reference point at their start or end,
+        "sameReference" for lines whose start and end snap to the same reference point (there is no slope between them).
+    """
+    progress = progress or SilentProgress()
+    workers = workerCount(workers)
+    if workers > 1 and partitionCount(len(lineIDs), workers) > 1:
+        return interpolateZDifferencesParallel(lineIDs, pointX, pointY, originalZs, refGrid, subInterpolate, progress, workers)
+
+    pointCount = len(lineIDs)
+
+    # First and last point of every line
+    lineStarts, lineEnds = lineEndpoints(lineIDs)
+    lineCount = len(lineStarts)
+
+    # Reference values per line, only this part loops (once per line instead of once per point)
+    progress.start("Suche Referenzpunkte für Linie {0}/{1}...", lineCount)
+    lineValid = numpy.zeros(lineCount, bool)
+    lineSame = numpy.zeros(lineCount, bool)
+    startRefs = numpy.zeros((lineCount, 3))
+    endRefs = numpy.zeros((lineCount, 3))
+    for lIndex in range(lineCount):
+        progress.update(lIndex)
+        startRef = refGrid.nearest(pointX[lineStarts[lIndex]], pointY[lineStarts[lIndex]])
+        endRef = refGrid.nearest(pointX[lineEnds[lIndex]], pointY[lineEnds[lIndex]])
+        if not startRef or not endRef:
+            continue
+        if isSameReference(startRef[0], startRef[1], endRef[0], endRef[1]):
+            lineSame[lIndex] = True
+            continue
+        lineValid[lIndex] = True
+        startRefs[lIndex] = startRef
+        endRefs[lIndex] = endRef
+    progress.finish()
+
+    # Spread line values to their points
+    pointLines = numpy.repeat(numpy.arange(lineCount), lineEnds - lineStarts + 1)
+    valid = lineValid[pointLines]
+    same = lineSame[pointLines]
+
+    progress.setLabel("Berechne {0} Punkte...".format(pointCount))
+    startRefs = startRefs[pointLines[valid]]
+    endRefs = endRefs[pointLines[valid]]
+
+    # Calculate base values
+    xLength = startRefs[:, 0] - endRefs[:, 0]
+    yLength = startRefs[:, 1] - endRefs[:, 1]
+    baseLength = (xLength * xLength) + (yLength * yLength)
+
+    # Calculate distance from start and end point
+    xLength = pointX[valid] - startRefs[:, 0]
+    yLength = pointY[valid] - startRefs[:, 1]
+    toStartLength = (xLength * xLength) + (yLength * yLength)
+
+    # Calculate Z-values
+    zDif = startRefs[:, 2] - endRefs[:, 2]
+    distanceFactor = numpy.sqrt(toStartLength / baseLength)
+    newZ = startRefs[:, 2] - (distanceFactor * zDif)
+
+    difToOriginal = newZ - originalZs[valid]
+    difToOriginal[difToOriginal <= .2] = 0 # Prevents pulling lines downwards + keeps already specific data in shape
+
+    difsToOriginal = numpy.zeros(pointCount)
+    difsToOriginal[valid] = difToOriginal
+    lengthsToStart = numpy.zeros(pointCount)
+    lengthsToStart[valid] = numpy.sqrt(toStartLength)
+    adjustedPoints = int(numpy.count_nonzero(valid))
+
+    if subInterpolate:
+        # Interpolation within lines, taking non-adjusted points as reference
+        progress.setLabel("Sub-Interpolation...")
+        difsToOriginal, subAdjusted = subInterpolatePoints(difsToOriginal, lineIDs, lengthsToStart, originalZs)
+        adjustedPoints += subAdjusted
+
+    return difsToOriginal, adjustedPoints, {"missingReference": numpy.flatnonzero(~valid & ~same), "sameReference": numpy.flatnonzero(same)}
+
+def referenceZDifferences(groupIDs, matchValues, pointX, pointY, originalZs, referenceGrid, tolerance, progress=None, workers=1):
+    """**Calculates the Z adjustment of connection points** from matching reference points and spreads it to connected lines.
+
+    :param list groupIDs: The line ID per point.
+    :param list matchValues: The XY-ID (X + Y) per point, used to snap connected points.
+    :param list pointX: The X coordinate per point.
+    :param list pointY: The Y coordinate per point.
+    :param list originalZs: The Z value per point.
+    :param PointGrid referenceGrid: The reference points with their Z value as item.
+    :param float tolerance: The maximum XY-ID difference for points to be snapped.
+    :param ProgressReporter progress: [optional] Reports the point loop.
+    :param int workers: [optional] The number of processes to split independent connection groups over, 0 uses all cores.
+    :returns: The Z adjustment per point as list and the number of adjustments made.
+    """
+    progress = progress or SilentProgress()
+    workers = workerCount(workers)
+    if workers > 1 and partitionCount(len(groupIDs), workers) > 1:
+        return referenceZDifferencesParallel(groupIDs, matchValues, pointX, pointY, originalZs, referenceGrid, tolerance, progress, workers)
+
+    pointCount = len(groupIDs)
+    adjustedPoints = 0
+    difsToOriginal = [0] * pointCount # Set to 0 as default, does not change position
+
+    # Connectivity graph: points of the same line form a component, points snapped within the tolerance are connected
+    progress.setLabel("Erstelle Verbindungsgraph...")
+    lineMembers = {} # Stores {groupID: [point indexes in order]}
+    for index, groupID in enumerate(groupIDs):
+        lineMembers.setdefault(groupID, []).append(index)
+    snapGraph = SnapGraph(matchValues, tolerance)
+
+    progress.start("Verarbeite Punkt {0}/{1}...", pointCount)
+    for cIndex in range(pointCount):
+        progress.update(cIndex)
+
+        # Search for matching reference points
+        referenceZ = referenceGrid.nearest(pointX[cIndex], pointY[cIndex])
+        if referenceZ is None:
+            continue
+
+        # Copy the adjustment (NOT the absolute) Z value
+        difsToOriginal[cIndex] = referenceZ - originalZs[cIndex]
+        adjustedPoints += 1
+
+        # Primary: points on the same line as the matched point, snap overlap in XY to base sewage
+        for rIndex in lineMembers[groupIDs[cIndex]]:
+            if rIndex == cIndex:
+                continue
+            if (matchValues[rIndex] > matchValues[cIndex] - tolerance) and (
+                    matchValues[rIndex] < matchValues[cIndex] + tolerance):
+                adjustedPoints += 1
+                difToOriginal = (originalZs[cIndex] + difsToOriginal[cIndex]) - originalZs[rIndex]
+                difsToOriginal[rIndex] = difToOriginal
+            else:
+                adjustedPoints += 1
+                difToOriginal = referenceZ - originalZs[rIndex]
+                if difToOriginal <= .2: difToOriginal = 0
+                difsToOriginal[rIndex] = difToOriginal
+
+            # Secondary: snap all non-adjusted points connected to the primary point by XY proximity
+            for sIndex in snapGraph.neighbours(rIndex):
+                if sIndex == rIndex or sIndex == cIndex or difsToOriginal[sIndex] != 0:
+                    continue
+                adjustedPoints += 1
+                difToOriginal = (originalZs[rIndex] + difsToOriginal[rIndex]) - originalZs[sIndex]
+                if difToOriginal <= .2: difToOriginal = 0
+                difsToOriginal[sIndex] = difToOriginal
+
+                # Tertiary: points of the same line as the secondary point
+                for fIndex in lineMembers[groupIDs[sIndex]]:
+                    if fIndex == sIndex or fIndex == cIndex or fIndex == rIndex:
+                        continue
+                    adjustedPoints += 1
+                    difToOriginal = (originalZs[sIndex] + difsToOriginal[sIndex]) - originalZs[fIndex]
+                    if difToOriginal <= .2: difToOriginal = 0
+                    difsToOriginal[fIndex] = difToOriginal
+    progress.finish()
+
+    return difsToOriginal, adjustedPoints
+
+# ---------------------------------------------------------------------------------------- #
+# Parallel processing
+
+def workerCount(workers):
+    """:returns: The number of worker processes to use, 0 means all cores."""
+    return workers or multiprocessing.cpu_count()
+
+def partitionCount(pointCount, workers):
+    """:returns: The number of partitions to split pointCount points into for the given number of workers."""
+    return max(1, min(workers * PARTITIONS_PER_WORKER, pointCount // MIN_PARTITION_POINTS))
+
+def lineEndpoints(lineIDs):
+    """:returns: The indexes of the first and the last point of every line, points of a line have to be consecutive."""
+    pointCount = len(lineIDs)
+    lineStarts = numpy.flatnonzero(numpy.r_[True, lineIDs[1:] != lineIDs[:-1]]) if pointCount else numpy.zeros(0, int)
+    lineEnds = numpy.r_[lineStarts[1:], pointCount] - 1
+    return lineStarts, lineEnds
+
+def processPool(workers, initializer=None, initargs=()):
+    """Creates a pool of worker processes. Inside ArcGIS Pro, sys.executable is ArcGISPro.exe,
+    so the workers are started with the Python interpreter of its environment instead.
+
+    :param int workers: The number of processes.
+    :param initializer: [optional] Called in every worker process as initializer(*initargs) when it starts.
+    :returns: multiprocessing.Pool
+    """
+    if sys.platform == "win32" and os.path.basename(sys.executable).lower() not in ("python.exe", "pythonw.exe"):
+        multiprocessing.set_executable(os.path.join(sys.exec_prefix, "python.exe"))
+    return multiprocessing.Pool(workers, initializer, initargs)
+
+def runPartitions(function, tasks, workers, progress):
+    """Runs function on every task, in a process pool if there is more than one task.
+
+    :returns: The results in the order of tasks.
+    """
+    progress.start("Verarbeite Teil {0}/{1}...", len(tasks))
+    results = []
+    if len(tasks) < 2:
+        for task in tasks:
+            results.append(function(task))
+    else:
+        pool = processPool(min(workers, len(tasks)))
+        try:
+            for result in pool.imap(function, tasks):
+                progress.update(len(results))
+                results.append(result)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    progress.finish()
+    return results
+
+def interpolatePartition(task):
+    """Worker of interpolateZDifferencesParallel, runs interpolateZDifferences on one partition of lines."""
+    lineIDs, pointX, pointY, originalZs, refEntries, tolerance, subInterpolate = task
+    return interpolateZDifferences(lineIDs, pointX, pointY, originalZs, PointGrid.fromEntries(tolerance, refEntries), subInterpolate)
+
+def interpolateZDifferencesParallel(lineIDs, pointX, pointY, originalZs, refGrid, subInterpolate, progress, workers):
+    """Same as interpolateZDifferences, split into partitions of whole lines.
+    Every partition only gets the reference points around the ends of its lines (one cell of the tolerance as halo).
+    """
+    pointCount = len(lineIDs)
+    lineStarts, lineEnds = lineEndpoints(lineIDs)
+
+    # Partition borders at the line start closest to an even split of the points
+    partitions = partitionCount(pointCount, workers)
+    splits = numpy.searchsorted(lineStarts, numpy.arange(1, partitions) * pointCount // partitions)
+    borders = numpy.unique(numpy.r_[0, lineStarts[numpy.minimum(splits, len(lineStarts) - 1)], pointCount])
+
+    progress.setLabel("Teile {0} Punkte in {1} Teile auf...".format(pointCount, len(borders) - 1))
+    tasks = []
+    for start, end in zip(borders[:-1], borders[1:]):
+        ends = numpy.r_[lineStarts[(lineStarts >= start) & (lineStarts < end)], lineEnds[(lineEnds >= start) & (lineEnds < end)]]
+        refEntries = refGrid.entriesNear(pointX[ends], pointY[ends])
+        tasks.append((lineIDs[start:end], pointX[start:end], pointY[start:end], originalZs[start:end], refEntries,
+                      refGrid.tolerance, subInterpolate))
+
+    results = runPartitions(interpolatePartition, tasks, workers, progress)
+    difsToOriginal = numpy.concatenate([difs for difs, adjusted, skipped in results])
+    adjustedPoints = sum(adjusted for difs, adjusted, skipped in results)
+    skipped = dict((category, numpy.concatenate([skipped[category] + start for (difs, adjusted, skipped), start in zip(results, borders)]))
+                   for category in results[0][2])
+    return difsToOriginal, adjustedPoints, skipped
+
+def connectionComponents(groupIDs, matchValues, tolerance):
+    """**Splits connection points into independent components**: points of the same line and points whose XY-IDs
+    are snapped to each other (see SnapGraph) end up in the same component.
+
+    :returns: The point indexes of every component in ascending order, components ordered by their first point.
+    """
+    pointCount = len(groupIDs)
+    parents = list(range(pointCount))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    def union(a, b):
+        a = find(a)
+        b = find(b)
+        if a != b:
+            parents[max(a, b)] = min(a, b)
+
+    firstPoints = {} # Stores {groupID: first point index}
+    for index, groupID in enumerate(groupIDs):
+        if groupID in firstPoints:
+            union(firstPoints[groupID], index)
+        else:
+            firstPoints[groupID] = index
+
+    # Snapped values are neighbours in sorted order. matchValues[b] >= matchValues[a], so only the strict upper bound
+    # of SnapGraph.neighbours(a) is left to check
+    order = sorted(range(pointCount), key=lambda index: matchValues[index])
+    for a, b in zip(order[:-1], order[1:]):
+        if matchValues[b] < matchValues[a] + tolerance:
+            union(a, b)
+
+    components = {}
+    for index in range(pointCount):
+        components.setdefault(find(index), []).append(index)
+    return [components[root] for root in sorted(components)]
+
+def referencePartition(task):
+    """Worker of referenceZDifferencesParallel, runs referenceZDifferences on one partition of connection components."""
+    groupIDs, matchValues, pointX, pointY, originalZs, refEntries, tolerance = task
+    return referenceZDifferences(groupIDs, matchValues, pointX, pointY, originalZs, PointGrid.fromEntries(tolerance, refEntries), tolerance)
+
+def referenceZDifferencesParallel(groupIDs, matchValues, pointX, pointY, originalZs, referenceGrid, tolerance, progress, workers):
+    """Same as referenceZDifferences, split into partitions of whole connection components.
+    Points keep their relative order within a partition, so every component is processed exactly like in one pass.
+    """
+    pointCount = len(groupIDs)
+    progress.setLabel("Suche unabhängige Anschlussgruppen...")
+    components = connectionComponents(groupIDs, matchValues, tolerance)
+
+    # Fill partitions with whole components up to an even share of the points
+    partitionSize = float(pointCount) / partitionCount(pointCount, workers)
+    partitions = [[]]
+    for component in components:
+        if partitions[-1] and len(partitions[-1]) + len(component) > partitionSize:
+            partitions.append([])
+        partitions[-1].extend(component)
+
+    progress.setLabel("Teile {0} Punkte in {1} Teile auf...".format(pointCount, len(partitions)))
+    tasks = []
+    for partition in partitions:
+        partition.sort()
+        partitionX = [pointX[index] for index in partition]
+        partitionY = [pointY[index] for index in partition]
+        tasks.append(([groupIDs[index] for index in partition], [matchValues[index] for index in partition], partitionX, partitionY,
+                      [originalZs[index] for index in partition], referenceGrid.entriesNear(partitionX, partitionY), tolerance))
+
+    difsToOriginal = [0] * pointCount
+    adjustedPoints = 0
+    for partition, (difs, adjusted) in zip(partitions, runPartitions(referencePartition, tasks, workers, progress)):
+        for index, dif in zip(partition, difs):
+            difsToOriginal[index] = dif
+        adjustedPoints += adjusted
+    return difsToOriginal, adjustedPoints
@@ -0,0 +1,1387 @@
+# The tool of Kanalhaltungen-anpassen.py: adjusts Haltungen and Anschlussleitungen with the manhole bottoms (Schachtsohlen).
+#
+# Importing the module neither runs the tool nor imports arcpy, the backend is only created by main or passed to runTool.
+# This way a warm worker (see serve) can create the backend once and run many jobs with the loaded geoprocessing
+# environment instead of importing arcpy again for every run. Kanalhaltungen-anpassen.py is the entry point of the
+# ArcGIS toolbox and the command line.
+
+import os
+import json
+import math
+import time
+import shutil
+import array
+import hashlib
+import binascii
+import traceback
+
+import numpy
+
+from subvision.backends import getBackend
+from subvision.progress import ProgressReporter, SilentProgress
+from subvision.profiling import Profiler, fileHash
+from subvision.pipeline import Stage, Pipeline, MessageBuffer
+from subvision.diagnostics import WarningCollector
+from subvision.interpolation import PointGrid, isSameReference, subInterpolatePoints, interpolateZDifferences, referenceZDifferences, connectionComponents, workerCount, processPool
+
+xyTolerance = .003 # in meters, maximum XY distance for points to be considered the same position
+vectorize = True # Interpolate Z values with NumPy arrays instead of looping over cursor rows
+inMemory = False # Keep intermediate feature classes in memory, only the *_out_lines results are written to the output folder
+outputFormat = "shp" # "shp" writes every feature class as shapefile, "gpkg" (GeoPackage) or "gdb" (file geodatabase, arcpy only) all of them into one indexed container
+editVertices = False # Edit the line vertices directly instead of converting to points and back, keeps the line attributes
+streaming = False # Stream the points through the cursors with only the needed fields instead of loading whole feature classes, for large datasets
+streamBatchSize = 10000 # Minimum number of points per streamed batch, batches always contain whole lines
+workers = 1 # Processes to split independent lines and connection groups over and to run independent stages in, 0 uses all cores. Small inputs always run in one process
+artifactCache = "cache" # Converted points per content hash of the inputs and the tool version, reruns with unchanged lines skip copying and converting them. Relative to the output folder, None to always convert
+incrementalCache = None # e.g. "incremental.json": line fingerprints in the output folder, reruns only recompute lines of changed manholes. Hashes all input vertices in every run, None to always run everything
+profileReport = "profile.json" # Timings, memory and row counts per stage, written to the output folder. None to disable
+warningReport = "warnings.csv" # Every point with a warning, written to the output folder if showWarnings is set. None to only print a summary
+traceMemory = False # Also measure the peak Python memory per stage in the profile report, slows the script down
+serverPort = 6070 # Port of the warm worker on this computer (--serve), see serve
+serverKeyFile = os.path.join("~", ".subvision", "worker.key") # Random authkey of the warm worker, only readable by the user. Not used if SUBVISION_AUTHKEY is set
+
+def logFeatureClasses(mode):
+    """**Logs all feature classes in the output folder** to log.txt within the output folder.
+
+    :param string mode: The file mode to use. Values: "w", "a"
+    """
+    if mode != "w" and mode != "a":
+        raise ValueError('Use "w" (write) or "a" (append) as mode.')
+
+    # Create feature classes array
+    featureClasses = backend.listFeatureClasses()
+
+    # Open log file
+    with open('log.txt', mode) as file:
+
+        # Iterate through feature classes
+        for featureClass in featureClasses:
+
+            path = os.path.join(backend.workspace, featureClass)
+            file.write("Feature class:     {0}\n".format(path))
+
+            # Create fields array
+            fields = backend.listFields(featureClass)
+            for field in fields:
+                file.write("    Field:       {0}\n".format(field.name))
+                file.write("    Type:        {0}\n".format(field.type))
+                file.write("    Alias:       {0}\n".format(field.aliasName))
+            #arcpy.CalculateField_management(haltung_intermediate, "haltung_XY", "[haltung_X]+[haltung_Y]")
+
+        file.write("\n")
+    # -------------------------------------------------------------------------------------#
+
+def updateProgress(label):
+    """**Updates the progress label** of the backend. Loops report through progress.start/update/finish instead.
+
+    :param string label: What to write into the label box.
+    :returns: void
+    """
+    progress.setLabel(label)
+    # -------------------------------------------------------------------------------------#
+
+def containerPath():
+    """:returns: The container in the output folder all feature classes are stored in, see outputFormat. None for shapefiles."""
+    if outputFormat == "shp":
+        return None
+    if outputFormat not in ("gpkg", "gdb"):
+        raise ValueError('Unknown outputFormat "{0}", use "shp", "gpkg" or "gdb".'.format(outputFormat))
+    return os.path.abspath("kanalhaltungen." + outputFormat) # The working directory is the output folder
+
+def outputFeature(name):
+    """**Returns where a feature class in the output folder is stored**, as shapefile or within the container, see outputFormat.
+
+    :param string name: The name of the feature class, with or without .shp.
+    :returns: string
+    """
+    if name[-4:] == ".shp":
+        name = name[:-4]
+    if containerPath():
+        return os.path.join(containerPath(), name)
+    return name + ".shp"
+
+def featurePath(name):
+    """**Returns where an intermediate feature class is stored.** In memory if inMemory is set, in the output folder otherwise.
+
+    :param string name: The name of the feature class, with or without .shp.
+    :returns: string
+    """
+    if inMemory:
+        return backend.memoryPath(name[:-4] if name[-4:] == ".shp" else name)
+    return outputFeature(name)
+
+def indexFeature(featureClass, fields):
+    """**Indexes an intermediate feature class within the container** by attribute fields, e.g. ORIG_FID for the
+    ordered cursors. Shapefiles and in memory feature classes aren't indexed.
+
+    :param string featureClass: The feature class, see featurePath.
+    :param list fields: The fields to index.
+    :returns: void
+    """
+    if not containerPath() or inMemory:
+        return
+    updateProgress("Indiziere {0}...".format(featureClass))
+    backend.addIndex(featureClass, fields)
+
+def copyFeature(input, output, intermediate=True):
+    """Copies a feature class to another destination.
+
+    :param string input: The feature class to copy.
+    :param string output: The name of the intermediate feature class to copy to, see featurePath.
+    :param bool intermediate: [optional] False to copy to output in the output folder, also if inMemory is set.
+    """
+
+    output = featurePath(output) if intermediate else outputFeature(output)
+
+    updateProgress("Kopiere Feature {0}...".format(input))
+    backend.copyFeatures(input, output)
+
+def convertFeatureToPoints(featureClass, artifactKey=None):
+    """**Converts a feature class to Points, creates Geometry attribute fields and adds an ID based on X/Y-coordinates.**
+    *Does not overwrite the input.*
+
+    :param string featureClass: The feature class to convert.
+    :param string artifactKey: [optional] Stores the points in the artifact cache under this key, see storeArtifact.
+    :returns: void
+    """
+
+    if featureClass[-4:] == ".shp":
+        featureClass = featureClass[:-4]
+
+    featureName = featureClass
+    feature = featurePath(featureClass)
+    # Convert lines to points
+    oldType = backend.shapeType(feature)
+    updateProgress("Konvertiere Vertices zu Punkten in {0}...".format(feature))
+    createPath = featurePath(featureName + "_toPoints") # Use featureName to write new feature
+    backend.featureVerticesToPoints(feature, createPath)
+    # backend.addMessage("{0} erfolgreich von {1} zu Point konvertiert.".format(feature, oldType))
+
+    # Calculate Geometry Attributes
+    feature = createPath # From now on, work with converted feature
+    featureName = featureName + "_toPoints"
+
+    # Add coordinate fields (ArcGIS 10.7 and up)
+    updateProgress("Berechne Punkt-Koordinaten in {0}...".format(feature))
+    backend.addGeometryAttributes(feature)
+    backend.deleteField(feature, "POINT_M")  # Delete, is never used
+
+    # Following method for 10.6 and below
+    # arcpy.AddField_management(featureClass, field_prefix + "_X", "DOUBLE")
+    # arcpy.AddField_management(featureClass, field_prefix + "_Y", "DOUBLE")
+    # arcpy.CalculateGeometryAttributes_management(featureClass, [["_X"], ["POINT_X"]])
+    # arcpy.CalculateGeometryAttributes_management(featureClass, [["_Y"], ["POINT_Y"]])
+
+    # Calculate XY-ID
+    field_prefix = featureClass[0:1]
+    backend.addField(feature, field_prefix + "_XY", "DOUBLE")
+    backend.calculateField(feature, field_prefix + "_XY", "[POINT_X] + [POINT_Y]")
+    indexFeature(feature, ["ORIG_FID"]) # The points are read ordered by line
+    if artifactKey:
+        storeArtifact(artifactKey, featureName) # Before the Z values are adjusted in place
+    updateProgress("{0} erfolgreich berechnet.".format(feature))
+    #-------------------------------------------------------------------------------------#
+
+def interpolatePointsZ(featureClass, referenceClass):
+    """Interpolates the Z values of converted Haltung points between the manholes. POINT_Z is updated along with the points.
+
+    :param string featureClass: The point feature class to adjust.
+    :param string referenceClass: The manholes to reference for start and end point.
+    :returns: void
+    """
+    interpolateFeatureZ(featureClass, "ORIG_FID", referenceClass, "schacht_X", "schacht_Y", "schacht_XY")
+
+def pointsToLines(featureClass, output):
+    """Converts points back to lines, one line per ORIG_FID.
+
+    :param string featureClass: The intermediate point feature class to convert, see featurePath.
+    :param string output: The name of the line feature class to create in the output folder, see outputFeature.
+    :returns: void
+    """
+    updateProgress("Wandle {0} in Linien um...".format(featureClass))
+    backend.pointsToLine(featurePath(featureClass), outputFeature(output), "ORIG_FID", "ORIG_FID")
+
+def changedDifferences(fids, difsToOriginal):
+    """Selects the points whose Z value changes, for backend.adjustPointZ.
+
+    :param fids: The FID of every point.
+    :param difsToOriginal: The Z difference of every point, in the same order.
+    :returns: {FID: Z difference} of the points with a difference other than 0.
+    """
+    return dict((int(fid), float(dif)) for fid, dif in zip(fids, difsToOriginal) if dif != 0)
+
+def writeZDifferences(featureClass, differences):
+    """**Writes Z differences back keyed by FID**: only changed points are written, POINT_Z is updated in place.
+
+    :param string featureClass: The point feature class.
+    :param dict differences: {FID: Z difference}, see changedDifferences.
+    :returns: void
+    """
+    updateProgress("Schreibe {0} geänderte Punkte in {1}...".format(len(differences), featureClass))
+    backend.adjustPointZ(featureClass, differences)
+
+def interpolateFeatureZ(featureClass, matchFieldID, referenceClass, refFieldX, refFieldY, refFieldID):
+    """Interpolates the Z value of a point feature based on a reference feature. Usage: Adjust a point on a line between to other points.
+
+    :param string featureClass: The feature class to adjust.
+    :param string matchFieldID: The name of the field in featureClass to match against refFieldID in referenceClass
+    :param string referenceClass: The feature class to reference for start and end point.
+    :param string refFieldX: The name of the field the reference X values are stored in.
+    :param string refFieldY: The name of the field the reference Y values are stored in.
+    :param string refFieldID: The name of the XY-ID field in referenceClass. Unused, reference points are matched by position within xyTolerance.
+    :returns: void
+    """
+    if streaming:
+        interpolateFeatureZStreaming(featureClass, matchFieldID, referenceClass, refFieldX, refFieldY)
+        return
+    if vectorize:
+        interpolateFeatureZVectorized(featureClass, matchFieldID, referenceClass, refFieldX, refFieldY)
+        return
+
+    featureClass = featurePath(featureClass)
+    referenceClass = featurePath(referenceClass)
+
+    # Util variables
+    saved_fid = None
+    adjustedPoints = 0
+
+    # Using the new data-access search cursor, because getValue() doesn't work for the old one, somehow
+    fields = [f.name for f in backend.listFields(featureClass)]
+    refFields = [f.name for f in backend.listFields(referenceClass)]
+
+    # Find indexes for field names
+    # Source feature ↓
+    xIndex = fields.index("POINT_X")
+    yIndex = fields.index("POINT_Y")
+    zIndex = fields.index("POINT_Z")
+    fidIndex = fields.index(backend.oidField(featureClass))
+    matchFieldIndex = fields.index(matchFieldID)
+    # Reference feature ↓
+    refIndexX = refFields.index(refFieldX)
+    refIndexY = refFields.index(refFieldY)
+    refIndexZ = refFields.index("Z")
+
+    # Build delimited field names (can cause SQL issues if not done)
+    matchFieldIDdelimited = backend.addFieldDelimiters(featureClass, matchFieldID)
+    FIDdelimited = backend.addFieldDelimiters(featureClass, backend.oidField(featureClass))
+    refFieldIDdelimited = backend.addFieldDelimiters(referenceClass, refFieldID)
+
+    # Fetch cursor into array to minize cursor usage
+    rows = [row for row in backend.updateCursor(featureClass, "*", sql_clause=(
+        None, "ORDER BY {0}, {1}".format(matchFieldIDdelimited, FIDdelimited)))]
+    refRows = [row for row in backend.searchCursor(referenceClass, "*")]
+    rowCount = len(rows)
+
+    # Index reference points by position, matching on the X+Y sum alone can mix up different points
+    refGrid = PointGrid(xyTolerance)
+    for refRow in refRows:
+        refGrid.insert(refRow[refIndexX], refRow[refIndexY], refRow)
+
+    # Find first and last row of every line in one pass, rows are sorted by line ID
+    lineBounds = {} # Stores {lineID: [firstIndex, lastIndex]}
+    for index, row in enumerate(rows):
+        if row[matchFieldIndex] in lineBounds:
+            lineBounds[row[matchFieldIndex]][1] = index
+        else:
+            lineBounds[row[matchFieldIndex]] = [index, index]
+
+    # Preallocated point info, one column per value
+    lengthsToStart = [0] * rowCount
+    difsToOriginal = [0] * rowCount
+    lineIDs = [row[matchFieldIndex] for row in rows]
+    originalZs = [row[zIndex] for row in rows]
+    skipped = {"missingReference": [], "sameReference": []} # Stores {warning category: point indexes}, see interpolateZDifferences
+
+    progress.start("Verarbeite Punkt {0}/{1}...", rowCount)
+    for cIndex in range(rowCount):
+        progress.update(cIndex)
+        row = rows[cIndex]
+        if saved_fid == lineIDs[cIndex]:
+            continueLine = True
+        else:
+            continueLine = False
+            saved_fid = lineIDs[cIndex]
+
+        if not continueLine:
+            # Get start+end points for line the current point was originally on
+            startPoint = rows[lineBounds[saved_fid][0]]
+            endPoint = rows[lineBounds[saved_fid][1]]
+
+            # Find reference points based on start and end point
+            startRef = refGrid.nearest(startPoint[xIndex], startPoint[yIndex])
+            endRef = refGrid.nearest(endPoint[xIndex], endPoint[yIndex])
+
+        if not startRef or not endRef:
+            skipped["missingReference"].append(cIndex)
+            row[zIndex] = 0
+            continue
+        if isSameReference(startRef[refIndexX], startRef[refIndexY], endRef[refIndexX], endRef[refIndexY]):
+            skipped["sameReference"].append(cIndex) # No base length to interpolate along
+            row[zIndex] = 0
+            continue
+
+        if not continueLine:
+            # Calculate base values
+            xLength = startRef[refIndexX] - endRef[refIndexX]
+            yLength = startRef[refIndexY] - endRef[refIndexY]
+            baseLength = (xLength * xLength) + (yLength * yLength)
+
+        # Calculate distance from start and end point
+        xLength = row[xIndex] - startRef[refIndexX]
+        yLength = row[yIndex] - startRef[refIndexY]
+        toStartLength = (xLength * xLength) + (yLength * yLength)
+
+        # Calculate Z-values
+        startZ = startRef[refIndexZ]
+        endZ = endRef[refIndexZ]
+        zDif = startZ - endZ  # Can be negative and should be able to
+        distanceFactor = math.sqrt((toStartLength / baseLength))
+        newZ = startZ - (distanceFactor * zDif)  # Calculate new Z coord based on distance to start point
+
+        difToOriginal = newZ - row[zIndex]
+        if difToOriginal <= .2:
+            difToOriginal = 0 # Prevents pulling lines downwards + keeps already specific data in shape
+
+        lengthsToStart[cIndex] = math.sqrt(toStartLength)
+        difsToOriginal[cIndex] = difToOriginal
+        row[zIndex] = difToOriginal
+        adjustedPoints += 1
+    progress.finish()
+    warnSkippedLines(featureClass, skipped, [row[fidIndex] for row in rows], lineIDs)
+
+    if subInterpolate:
+        # Interpolation within lines, taking non-adjusted points as reference
+        updateProgress("Sub-Interpolation...")
+        subDifs, subAdjusted = subInterpolatePoints(difsToOriginal, lineIDs, lengthsToStart, originalZs)
+        for cIndex in range(rowCount):
+            rows[cIndex][zIndex] = float(subDifs[cIndex])
+        adjustedPoints += subAdjusted
+
+    writeZDifferences(featureClass, changedDifferences([row[fidIndex] for row in rows], [row[zIndex] for row in rows]))
+    updateProgress("Alle Punkte in {0} erfolgreich interpoliert!".format(featureClass))
+
+    # -------------------------------------------------------------------------------------#
+
+def referencePointGrid(referenceClass, refFieldX, refFieldY):
+    """Indexes the reference points (manholes) of the Z interpolation by position.
+
+    :param string referenceClass: The feature class with the reference points.
+    :param string refFieldX: The name of the field the reference X values are stored in.
+    :param string refFieldY: The name of the field the reference Y values are stored in.
+    :returns: PointGrid with (X, Y, Z) tuples as items.
+    """
+    refGrid = PointGrid(xyTolerance)
+    for refRow in backend.searchCursor(referenceClass, [refFieldX, refFieldY, "Z"]):
+        refGrid.insert(refRow[0], refRow[1], refRow)
+    return refGrid
+
+def warnSkippedLines(featureClass, skipped, fids, lineIDs):
+    """Collects a warning for every point of a line that couldn't be interpolated, if showWarnings is set.
+    Only a summary is printed at the end, see reportWarnings.
+
+    :param string featureClass: The feature class of the points.
+    :param dict skipped: {warning category: indexes of the points}, as returned by interpolateZDifferences.
+    :param fids: The FID per point, None for line vertices.
+    :param lineIDs: The FID of the line per point.
+    :returns: void
+    """
+    if not showWarnings:
+        return
+    for category in sorted(skipped):
+        indexes = skipped[category]
+        warningCollector.add(category, featureClass, [None] * len(indexes) if fids is None else [fids[index] for index in indexes],
+                             [lineIDs[index] for index in indexes])
+
+def interpolateFeatureZVectorized(featureClass, matchFieldID, referenceClass, refFieldX, refFieldY):
+    """Same as interpolateFeatureZ, but computes all points at once on NumPy arrays. Only the needed columns are loaded.
+
+    :param string featureClass: The feature class to adjust.
+    :param string matchFieldID: The name of the field in featureClass to group lines by.
+    :param string referenceClass: The feature class to reference for start and end point.
+    :param string refFieldX: The name of the field the reference X values are stored in.
+    :param string refFieldY: The name of the field the reference Y values are stored in.
+    :returns: void
+    """
+    featureClass = featurePath(featureClass)
+    referenceClass = featurePath(referenceClass)
+
+    updateProgress("Lade Punkte aus {0}...".format(featureClass))
+    points = backend.featureClassToNumPyArray(featureClass, [matchFieldID, "OID@", "POINT_X", "POINT_Y", "POINT_Z"])
+    points = points[numpy.lexsort((points["OID@"], points[matchFieldID]))] # Same order as "ORDER BY matchFieldID, FID"
+
+    difsToOriginal, adjustedPoints, skipped = interpolateZDifferences(points[matchFieldID], points["POINT_X"], points["POINT_Y"], points["POINT_Z"],
+                                                                      referencePointGrid(referenceClass, refFieldX, refFieldY),
+                                                                      subInterpolate, progress, workers)
+    warnSkippedLines(featureClass, skipped, points["OID@"], points[matchFieldID])
+
+    changed = difsToOriginal != 0
+    writeZDifferences(featureClass, dict(zip(points["OID@"][changed].tolist(), difsToOriginal[changed].tolist())))
+    updateProgress("{0} Punkte in {1} erfolgreich interpoliert!".format(adjustedPoints, featureClass))
+
+    # -------------------------------------------------------------------------------------#
+
+def interpolateFeatureZStreaming(featureClass, matchFieldID, referenceClass, refFieldX, refFieldY):
+    """Same as interpolateFeatureZ, but streams the points through an ordered cursor with only the needed fields.
+    Whole lines are collected into batches of streamBatchSize points, so only one batch is held in memory at a time.
+    The changed points of each finished batch are written back right away.
+
+    :param string featureClass: The feature class to adjust.
+    :param string matchFieldID: The name of the field in featureClass to group lines by.
+    :param string referenceClass: The feature class to reference for start and end point.
+    :param string refFieldX: The name of the field the reference X values are stored in.
+    :param string refFieldY: The name of the field the reference Y values are stored in.
+    :returns: void
+    """
+    featureClass = featurePath(featureClass)
+    referenceClass = featurePath(referenceClass)
+
+    refGrid = referencePointGrid(referenceClass, refFieldX, refFieldY)
+    sqlClause = (None, "ORDER BY {0}, {1}".format(backend.addFieldDelimiters(featureClass, matchFieldID),
+                                                  backend.addFieldDelimiters(featureClass, backend.oidField(featureClass))))
+    adjustedPoints = 0
+    pointCount = 0
+
+    # Batches contain whole lines, writing the points of a finished batch doesn't touch the rows the cursor reads next
+    with backend.searchCursor(featureClass, [matchFieldID, "OID@", "POINT_X", "POINT_Y", "POINT_Z"], sql_clause=sqlClause) as reader:
+        batch = []
+        for row in reader:
+            if len(batch) >= streamBatchSize and row[0] != batch[-1][0]:
+                adjustedPoints += interpolateStreamBatch(featureClass, batch, pointCount, refGrid)
+                pointCount += len(batch)
+                batch = []
+            batch.append(row)
+        if batch:
+            adjustedPoints += interpolateStreamBatch(featureClass, batch, pointCount, refGrid)
+
+    updateProgress("{0} Punkte in {1} erfolgreich interpoliert!".format(adjustedPoints, featureClass))
+
+def interpolateStreamBatch(featureClass, batch, firstIndex, refGrid):
+    """Interpolates a batch of whole lines and writes the Z differences of its changed points, see writeZDifferences.
+
+    :param string featureClass: The feature class of the points.
+    :param list batch: The rows of the batch as (line ID, FID, X, Y, Z).
+    :param int firstIndex: The index of the first point of the batch within the feature class.
+    :param PointGrid refGrid: The reference points, see referencePointGrid.
+    :returns: The number of adjusted points.
+    """
+    updateProgress("Verarbeite Punkt {0} bis {1}...".format(firstIndex, firstIndex + len(batch) - 1))
+    columns = numpy.array([row[2:] for row in batch], dtype=float)
+    difsToOriginal, adjustedPoints, skipped = interpolateZDifferences(numpy.array([row[0] for row in batch]), columns[:, 0], columns[:, 1],
+                                                                      columns[:, 2], refGrid, subInterpolate)
+    warnSkippedLines(featureClass, skipped, [row[1] for row in batch], [row[0] for row in batch])
+
+    differences = changedDifferences([row[1] for row in batch], difsToOriginal)
+    if differences:
+        writeZDifferences(featureClass, differences)
+    return adjustedPoints
+
+    # -------------------------------------------------------------------------------------#
+
+def adjust3DZbyReference(featureA, matchA, groupA, featureB, matchB):
+    """Takes Z values from featureB and transfers them to featureA where their points lie within xyTolerance.
+    Assumes the input feature contains 3D points.
+    Group parameter is currently ignored.
+
+    :param string featureA: The feature class to adjust.
+    :param string matchA: The name of the XY-ID field in featureA, used to snap connected points.
+    :param string groupA: The field to group featureA by.
+    :param string featureB: The feature class to reference.
+    :param string matchB: The name of the XY-ID field in featureB. Unused, reference points are matched by position within xyTolerance.
+    :returns: void
+    """
+    if streaming:
+        adjust3DZbyReferenceStreaming(featureA, matchA, groupA, featureB, matchB)
+        return
+
+    featureA = featurePath(featureA)
+    featureB = featurePath(featureB)
+
+    updateProgress("Passe 3D-Positionen von {0} an...".format(featureA))
+
+    # Fetch all fields of features to reference later
+    Afields = [f.name for f in backend.listFields(featureA)]
+
+    # Find indexes for field names
+    AmatchIndex = Afields.index(matchA)
+    AxIndex = Afields.index("POINT_X")
+    AyIndex = Afields.index("POINT_Y")
+    AzIndex = Afields.index("POINT_Z")
+    AgroupIndex = Afields.index(groupA)
+    AfidIndex = Afields.index(backend.oidField(featureA))
+
+    # Fetch cursor into array to minize cursor usage, only coordinates are needed from the reference
+    Arows = [row for row in backend.updateCursor(featureA, "*", sql_clause=(
+        None, "ORDER BY {0}, {1} DESC".format(groupA, backend.oidField(featureA))))]
+    Brows = [row for row in backend.searchCursor(featureB, ["POINT_X", "POINT_Y", "POINT_Z"])]
+
+    # Hash join on the reference positions
+    updateProgress("Suche nach übereinstimmenden IDs von {0}...".format(featureA))
+    referenceGrid = PointGrid(xyTolerance)
+    for Brow in Brows:
+        referenceGrid.insert(Brow[0], Brow[1], Brow[2])
+
+    difsToOriginal, adjustedPoints = referenceZDifferences([Arow[AgroupIndex] for Arow in Arows], [Arow[AmatchIndex] for Arow in Arows],
+                                                           [Arow[AxIndex] for Arow in Arows], [Arow[AyIndex] for Arow in Arows],
+                                                           [Arow[AzIndex] for Arow in Arows], referenceGrid,
+                                                           xyTolerance, progress, workers)
+
+    writeZDifferences(featureA, changedDifferences([Arow[AfidIndex] for Arow in Arows], difsToOriginal))
+    updateProgress("{0} Punkte in {1} erfolgreich angepasst!".format(adjustedPoints, featureA))
+
+    # -------------------------------------------------------------------------------------#
+
+def adjust3DZbyReferenceStreaming(featureA, matchA, groupA, featureB, matchB):
+    """Same as adjust3DZbyReference, but only reads the needed fields into compact columns instead of whole rows.
+    Adjustments spread to snapped points of other lines, so unlike interpolateFeatureZStreaming the points
+    can't be processed one line at a time.
+
+    :param string featureA: The feature class to adjust.
+    :param string matchA: The name of the XY-ID field in featureA, used to snap connected points.
+    :param string groupA: The field to group featureA by.
+    :param string featureB: The feature class to reference.
+    :param string matchB: The name of the XY-ID field in featureB. Unused, reference points are matched by position within xyTolerance.
+    :returns: void
+    """
+    featureA = featurePath(featureA)
+    featureB = featurePath(featureB)
+
+    updateProgress("Passe 3D-Positionen von {0} an...".format(featureA))
+    sqlClause = (None, "ORDER BY {0}, {1} DESC".format(groupA, backend.oidField(featureA)))
+
+    # One column per value, floats are stored as plain doubles instead of Python objects
+    groupIDs = []
+    fids = array.array("l")
+    matchValues = array.array("d")
+    pointX = array.array("d")
+    pointY = array.array("d")
+    originalZs = array.array("d")
+    for groupID, fid, matchValue, x, y, z in backend.searchCursor(featureA, [groupA, "OID@", matchA, "POINT_X", "POINT_Y", "POINT_Z"], sql_clause=sqlClause):
+        groupIDs.append(groupID)
+        fids.append(fid)
+        matchValues.append(matchValue)
+        pointX.append(x)
+        pointY.append(y)
+        originalZs.append(z)
+
+    updateProgress("Suche nach übereinstimmenden IDs von {0}...".format(featureA))
+    referenceGrid = PointGrid(xyTolerance)
+    for x, y, z in backend.searchCursor(featureB, ["POINT_X", "POINT_Y", "POINT_Z"]):
+        referenceGrid.insert(x, y, z)
+
+    difsToOriginal, adjustedPoints = referenceZDifferences(groupIDs, matchValues, pointX, pointY, originalZs, referenceGrid,
+                                                           xyTolerance, progress, workers)
+
+    writeZDifferences(featureA, changedDifferences(fids, difsToOriginal))
+    updateProgress("{0} Punkte in {1} erfolgreich angepasst!".format(adjustedPoints, featureA))
+
+    # -------------------------------------------------------------------------------------#
+
+def lineVertexArrays(lines, reverse=False):
+    """Flattens the vertices of lines into one array per coordinate.
+
+    :param list lines: (FID, parts) per line as returned by backend.lineVertices.
+    :param bool reverse: Whether to list the vertices of each line in reverse order.
+    :returns: lineIDs, pointX, pointY, pointZ
+    """
+    vertices = []
+    for fid, parts in lines:
+        lineVertices = [(fid,) + tuple(vertex) for part in parts for vertex in part]
+        vertices.extend(reversed(lineVertices) if reverse else lineVertices)
+    columns = numpy.array(vertices, dtype=float).reshape(-1, 4)
+    return columns[:, 0].astype(int), columns[:, 1], columns[:, 2], columns[:, 3]
+
+def lineZValues(lines, newZs, reverse=False):
+    """Splits the new Z values of all vertices back into lines and parts, the counterpart of lineVertexArrays.
+
+    :returns: {FID: [[Z per vertex] per part]}
+    """
+    zValues = {}
+    vIndex = 0
+    for fid, parts in lines:
+        vertexCount = sum(len(part) for part in parts)
+        lineZs = list(newZs[vIndex:vIndex + vertexCount])
+        if reverse:
+            lineZs.reverse()
+        vIndex += vertexCount
+
+        zValues[fid] = []
+        for part in parts:
+            zValues[fid].append([float(z) for z in lineZs[:len(part)]])
+            lineZs = lineZs[len(part):]
+    return zValues
+
+def interpolateLineVerticesZ(lineClass, referenceClass, refFieldX, refFieldY):
+    """Same as interpolateFeatureZ, but edits the vertices of a line feature class directly instead of converted points.
+    Lines are read and written in one pass each, their attributes are kept.
+
+    :param string lineClass: The line feature class to adjust.
+    :param string referenceClass: The feature class to reference for start and end point.
+    :param string refFieldX: The name of the field the reference X values are stored in.
+    :param string refFieldY: The name of the field the reference Y values are stored in.
+    :returns: void
+    """
+    updateProgress("Lade Vertices aus {0}...".format(lineClass))
+    lines = sorted(backend.lineVertices(lineClass))
+    lineIDs, pointX, pointY, originalZs = lineVertexArrays(lines)
+
+    difsToOriginal, adjustedPoints, skipped = interpolateZDifferences(lineIDs, pointX, pointY, originalZs,
+                                                                      referencePointGrid(referenceClass, refFieldX, refFieldY),
+                                                                      subInterpolate, progress, workers)
+    warnSkippedLines(lineClass, skipped, None, lineIDs)
+
+    updateProgress("Schreibe interpolierte Vertices in Feature...")
+    backend.updateLineZ(lineClass, lineZValues(lines, originalZs + difsToOriginal))
+    updateProgress("{0} Punkte in {1} erfolgreich interpoliert!".format(adjustedPoints, lineClass))
+
+def adjustLineVerticesZbyReference(lineClass, referenceClass):
+    """Same as adjust3DZbyReference, but edits the vertices of a line feature class directly instead of converted points.
+    The reference are the vertices of another line feature class, lines are read and written in one pass each.
+
+    :param string lineClass: The line feature class to adjust.
+    :param string referenceClass: The line feature class to reference.
+    :returns: void
+    """
+    updateProgress("Passe 3D-Positionen von {0} an...".format(lineClass))
+    lines = sorted(backend.lineVertices(lineClass))
+    lineIDs, pointX, pointY, originalZs = lineVertexArrays(lines, reverse=True) # Same order as "ORDER BY ORIG_FID, FID DESC"
+
+    referenceGrid = PointGrid(xyTolerance)
+    for fid, parts in backend.lineVertices(referenceClass):
+        for part in parts:
+            for x, y, z in part:
+                referenceGrid.insert(x, y, z)
+
+    difsToOriginal, adjustedPoints = referenceZDifferences(lineIDs.tolist(), (pointX + pointY).tolist(), pointX.tolist(),
+                                                           pointY.tolist(), originalZs.tolist(), referenceGrid,
+                                                           xyTolerance, progress, workers)
+
+    updateProgress("Schreibe {0} angepasste Punkte in Feature {1}...".format(adjustedPoints, lineClass))
+    backend.updateLineZ(lineClass, lineZValues(lines, originalZs + numpy.array(difsToOriginal), reverse=True))
+    updateProgress("{0} Punkte in {1} erfolgreich angepasst!".format(adjustedPoints, lineClass))
+
+    # -------------------------------------------------------------------------------------#
+
+def lineHash(values):
+    """:returns: A hash of the repr of values, e.g. the vertices of a line."""
+    return hashlib.sha1(repr(values).encode("utf-8")).hexdigest()
+
+def lineFingerprints(haltungLines, anschlussLines, refGrid):
+    """**Fingerprints of the input lines** for incremental reruns.
+    Haltungen store their vertex hash and the manholes at their start and end, Anschlüsse their vertex hash.
+
+    :param list haltungLines: (FID, parts) per Haltung as returned by backend.lineVertices.
+    :param list anschlussLines: (FID, parts) per Anschluss as returned by backend.lineVertices.
+    :param PointGrid refGrid: The manholes, see referencePointGrid.
+    :returns: {"haltungen": {FID: [vertexHash, manholeHash]}, "anschluesse": {FID: vertexHash}}, FIDs as strings for JSON.
+    """
+    haltungen = {}
+    for fid, parts in haltungLines:
+        vertices = [vertex for part in parts for vertex in part]
+        manholes = []
+        if vertices:
+            for x, y, z in (vertices[0], vertices[-1]):
+                manhole = refGrid.nearest(x, y)
+                manholes.append(tuple(float(value) for value in manhole) if manhole else None)
+        haltungen[str(fid)] = [lineHash(parts), lineHash(manholes)]
+    anschluesse = dict((str(fid), lineHash(parts)) for fid, parts in anschlussLines)
+    return {"haltungen": haltungen, "anschluesse": anschluesse}
+
+def outputLineIDs(lineClass):
+    """Maps input line FIDs to the FIDs of an output line feature class, through ORIG_FID if PointsToLine created it.
+
+    :param string lineClass: The output line feature class.
+    :returns: {input FID as string: output FID}
+    """
+    if "ORIG_FID" in [f.name for f in backend.listFields(lineClass)]:
+        return dict((str(origFID), fid) for fid, origFID in backend.searchCursor(lineClass, ["OID@", "ORIG_FID"]))
+    return dict((str(row[0]), row[0]) for row in backend.searchCursor(lineClass, ["OID@"]))
+
+def loadIncrementalCache(path, settings, fingerprints):
+    """Loads the cache of the previous run if an incremental update is possible: same settings and inputs,
+    existing outputs and unchanged line geometries. Only manholes may have changed.
+
+    :param string path: The cache file in the output folder.
+    :param dict settings: The settings of this run, see incrementalSettings.
+    :param dict fingerprints: The fingerprints of this run, see lineFingerprints.
+    :returns: The cache as dict, None if everything has to be recomputed.
+    """
+    if not os.path.exists(path) or not backend.exists(outputFeature("haltungen_out_lines")) or not backend.exists(outputFeature("anschluss_out_lines")):
+        return None
+    try:
+        with open(path) as file:
+            cache = json.load(file)
+    except ValueError:
+        return None
+
+    if cache.get("settings") != settings:
+        return None
+    cachedHaltungen = cache["fingerprints"]["haltungen"]
+    if set(cachedHaltungen) != set(fingerprints["haltungen"]) or cache["fingerprints"]["anschluesse"] != fingerprints["anschluesse"]:
+        return None
+    for fid, (vertexHash, manholeHash) in fingerprints["haltungen"].items():
+        if cachedHaltungen[fid][0] != vertexHash:
+            return None
+    return cache
+
+def saveIncrementalCache(path, settings, fingerprints):
+    """Writes the cache for the next run, after all outputs have been written. It contains the collected warnings,
+    so a rerun keeps those of the lines it doesn't recompute.
+
+    :returns: void
+    """
+    with open(path, "w") as file:
+        json.dump({
+            "settings": settings,
+            "fingerprints": fingerprints,
+            "warnings": warningCollector.entries,
+            "outputs": {"haltungen": outputLineIDs(outputFeature("haltungen_out_lines")), "anschluesse": outputLineIDs(outputFeature("anschluss_out_lines"))},
+        }, file)
+
+def writeOutputLineZ(lineClass, lines, newZs, outputIDs, reverse=False):
+    """Writes the new Z values of input lines to the matching lines of an output feature class.
+
+    :param string lineClass: The output line feature class.
+    :param list lines: (FID, parts) of the input lines, in the order of newZs.
+    :param array newZs: The new Z value per vertex, see lineVertexArrays.
+    :param dict outputIDs: {input FID as string: output FID}, see outputLineIDs. Lines without output are skipped.
+    :param bool reverse: Whether newZs lists the vertices of each line in reverse order.
+    :returns: void
+    """
+    outputLines = dict(backend.lineVertices(lineClass))
+    targets = []
+    written = []
+    for fid, parts in lines:
+        outputFID = outputIDs.get(str(fid))
+        if outputFID is not None:
+            targets.append((outputFID, outputLines[outputFID]))
+        written.extend([outputFID is not None] * sum(len(part) for part in parts))
+    backend.updateLineZ(lineClass, lineZValues(targets, numpy.asarray(newZs)[numpy.array(written, bool)], reverse))
+
+def updateIncrementally(cache, fingerprints, haltungLines, anschlussLines, refGrid):
+    """**Recomputes only the lines affected by changed manholes** and writes them into the existing outputs.
+    These are the Haltungen whose start or end manhole changed and the connection groups snapped to them.
+
+    :param dict cache: The cache of the previous run, see loadIncrementalCache.
+    :param dict fingerprints: The fingerprints of this run, see lineFingerprints.
+    :param list haltungLines: (FID, parts) per Haltung of the input.
+    :param list anschlussLines: (FID, parts) per Anschluss of the input.
+    :param PointGrid refGrid: The manholes, see referencePointGrid.
+    :returns: void
+    """
+    cachedHaltungen = cache["fingerprints"]["haltungen"]
+    changed = set(fid for fid, (vertexHash, manholeHash) in fingerprints["haltungen"].items() if cachedHaltungen[fid][1] != manholeHash)
+
+    # Warnings of the previous run for the lines that aren't recomputed, only Haltungen are warned about
+    for category, feature, fids, lineIDs in cache.get("warnings", []):
+        kept = [index for index, lineID in enumerate(lineIDs) if str(lineID) not in changed]
+        if kept:
+            warningCollector.extend([(category, feature, [fids[index] for index in kept], [lineIDs[index] for index in kept])])
+
+    if not changed:
+        backend.addMessage("Keine geänderten Schächte, Ausgabe ist aktuell.")
+        return
+
+    # Haltungen are independent of each other, only the changed ones are interpolated
+    changedLines = sorted((fid, parts) for fid, parts in haltungLines if str(fid) in changed)
+    updateProgress("Interpoliere {0} Haltungen an geänderten Schächten...".format(len(changedLines)))
+    lineIDs, pointX, pointY, originalZs = lineVertexArrays(changedLines)
+    difsToOriginal, adjustedPoints, skipped = interpolateZDifferences(lineIDs, pointX, pointY, originalZs, refGrid, subInterpolate, progress, workers)
+    warnSkippedLines(outputFeature("haltungen_out_lines"), skipped, None, lineIDs)
+    writeOutputLineZ(outputFeature("haltungen_out_lines"), changedLines, originalZs + difsToOriginal, cache["outputs"]["haltungen"])
+
+    # Connection groups with a point at a changed Haltung, in the same order as adjust3DZbyReference
+    changedGrid = PointGrid(xyTolerance)
+    for x, y in zip(pointX, pointY):
+        changedGrid.insert(x, y, True)
+    anschlussLines = sorted(anschlussLines)
+    groupIDs, anschlussX, anschlussY, anschlussZs = lineVertexArrays(anschlussLines, reverse=True)
+    matchValues = (anschlussX + anschlussY).tolist()
+    affected = []
+    for component in connectionComponents(groupIDs.tolist(), matchValues, xyTolerance):
+        if any(changedGrid.nearest(anschlussX[index], anschlussY[index]) for index in component):
+            affected.extend(component)
+    affected.sort()
+
+    updateProgress("Passe {0} Anschlusspunkte an geänderten Haltungen an...".format(len(affected)))
+    referenceGrid = PointGrid(xyTolerance)
+    for fid, parts in backend.lineVertices(outputFeature("haltungen_out_lines")):
+        for part in parts:
+            for x, y, z in part:
+                referenceGrid.insert(x, y, z)
+    connectionDifs, adjustedConnections = referenceZDifferences([int(groupIDs[index]) for index in affected], [matchValues[index] for index in affected],
+                                                                anschlussX[affected].tolist(), anschlussY[affected].tolist(),
+                                                                anschlussZs[affected].tolist(), referenceGrid, xyTolerance, progress, workers)
+    affectedGroups = set(int(groupIDs[index]) for index in affected)
+    writeOutputLineZ(outputFeature("anschluss_out_lines"), [line for line in anschlussLines if line[0] in affectedGroups],
+                     anschlussZs[affected] + numpy.array(connectionDifs), cache["outputs"]["anschluesse"], reverse=True)
+
+    backend.addMessage("{0} Haltungen und {1} Anschlüsse an geänderten Schächten neu berechnet.".format(len(changedLines), len(affectedGroups)))
+
+    # -------------------------------------------------------------------------------------#
+
+def toolVersion():
+    """:returns: A hash of all modules of the tool, artifacts of other versions of it aren't reused."""
+    folder = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(folder)):
+        if name[-3:] == ".py":
+            digest.update("{0}:{1}\n".format(name, fileHash(os.path.join(folder, name))).encode("utf-8"))
+    return digest.hexdigest()
+
+def inputHash(input):
+    """**Hashes the content of an input shapefile**, its .shp, .shx, .dbf, .prj and .cpg files.
+
+    :param string input: The shapefile.
+    :returns: string, None if input isn't a shapefile (e.g. a feature class in a geodatabase), it isn't cached then.
+    """
+    if input[-4:].lower() != ".shp" or not os.path.isfile(input):
+        return None
+    digest = hashlib.sha1()
+    for extension in (".shp", ".shx", ".dbf", ".prj", ".cpg"):
+        path = input[:-4] + extension
+        if not os.path.isfile(path):
+            continue
+        digest.update(extension.encode("utf-8"))
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def artifactKey(input, name, version):
+    """**Returns the key of an artifact**, a hash of everything it is built from: the content of the input, the tool version,
+    the backend and the output format. Settings that only affect later stages (e.g. subInterpolate) aren't part of it.
+
+    :param string input: The input feature class the artifact is converted from.
+    :param string name: The name of the artifact, e.g. "haltungen_out_toPoints".
+    :param string version: The tool version, see toolVersion.
+    :returns: string, None if the input can't be cached.
+    """
+    content = inputHash(input)
+    if not artifactCache or inMemory or content is None:
+        return None
+    return lineHash([name, content, version, backend.name, outputFormat])
+
+def artifactFolder(key):
+    """:returns: The folder of the entry of key in the artifact cache."""
+    return os.path.join(os.path.abspath(artifactCache), key) # Relative to the output folder
+
+def artifactFeature(folder, name):
+    """:returns: Where an artifact is stored within the folder of its entry, in the same format as the intermediates."""
+    if outputFormat == "shp":
+        return os.path.join(folder, name + ".shp")
+    return os.path.join(folder, "artifact." + outputFormat, name)
+
+def hasArtifact(key):
+    """:returns: True if the artifact of key was stored by an earlier run."""
+    return os.path.exists(os.path.join(artifactFolder(key), "artifact.json"))
+
+def storeArtifact(key, name):
+    """**Stores an intermediate feature class in the artifact cache.** It is written to a temporary folder that is renamed
+    to the entry of key when it is complete, so runs sharing the cache never see or remove a partly written entry.
+    An existing entry is kept.
+
+    :param string key: The key of the artifact, see artifactKey.
+    :param string name: The name of the intermediate feature class.
+    :returns: void
+    """
+    folder = artifactFolder(key)
+    if os.path.exists(folder):
+        return
+    temporary = "{0}.{1}.tmp".format(folder, binascii.hexlify(os.urandom(8)).decode("ascii"))
+    os.makedirs(temporary)
+    try:
+        if outputFormat != "shp":
+            backend.createContainer(os.path.dirname(artifactFeature(temporary, name)))
+        updateProgress("Speichere {0} im Cache...".format(name))
+        backend.copyFeatures(featurePath(name), artifactFeature(temporary, name))
+        with open(os.path.join(temporary, "artifact.json"), "w") as file:
+            json.dump({"name": name, "created": time.strftime("%Y-%m-%d %H:%M:%S")}, file)
+        os.rename(temporary, folder)
+    except OSError:
+        pass # Stored by another run in the meantime, or the copy is still locked. The artifact is only not cached then
+    finally:
+        if os.path.exists(temporary):
+            shutil.rmtree(temporary, ignore_errors=True)
+
+def restoreArtifact(key, name):
+    """**Copies an artifact from the cache** to its intermediate feature class, instead of copying and converting the input again.
+
+    :param string key: The key of the artifact, see artifactKey.
+    :param string name: The name of the intermediate feature class.
+    :returns: void
+    """
+    updateProgress("Lade {0} aus dem Cache...".format(name))
+    feature = featurePath(name)
+    backend.copyFeatures(artifactFeature(artifactFolder(key), name), feature)
+    indexFeature(feature, ["ORIG_FID"])
+
+    # -------------------------------------------------------------------------------------#
+
+def pointStages(haltung_path, anschluss_path, schacht_path, artifactKeys=None):
+    """**The stages of converting the lines to points, adjusting them and converting them back.**
+    Data names are the feature classes without .shp, ":z" marks a feature class after its Z values were adjusted.
+    Points found in the artifact cache are restored from it instead of copying and converting the lines.
+
+    :param dict artifactKeys: [optional] {name of the points: key in the artifact cache}, see artifactKey.
+    :returns: list of Stage
+    """
+    artifactKeys = artifactKeys or {}
+    copies = []
+    conversions = []
+    for label, input, name in (("Haltungen", haltung_path, "haltungen_out"), ("Anschlussdaten", anschluss_path, "anschluss_out")):
+        key = artifactKeys.get(name + "_toPoints")
+        if key and hasArtifact(key):
+            conversions.insert(0, Stage("Zu Punkte konvertieren ({0}, Cache)".format(label), restoreArtifact, (key, name + "_toPoints"),
+                                        [], [name + "_toPoints"]))
+            continue
+        copies.append(Stage("Kopieren ({0})".format(label), copyFeature, (input, name + ".shp"), [input], [name]))
+        conversions.insert(0, Stage("Zu Punkte konvertieren ({0})".format(label), convertFeatureToPoints, (name + ".shp", key),
+                                    [name], [name + "_toPoints"]))
+    copies.append(Stage("Kopieren (Schächte)", copyFeature, (schacht_path, "schacht_out.shp"), [schacht_path], ["schacht_out"]))
+    return copies + conversions + [
+        Stage("3D Daten anpassen (Haltungen)", interpolatePointsZ, ("haltungen_out_toPoints", "schacht_out"),
+              ["haltungen_out_toPoints", "schacht_out"], ["haltungen_out_toPoints:z"]),
+        Stage("3D Daten anpassen (Anschlussdaten)", adjust3DZbyReference, ("anschluss_out_toPoints", "a_XY", "ORIG_FID", "haltungen_out_toPoints", "h_XY"),
+              ["anschluss_out_toPoints", "haltungen_out_toPoints:z"], ["anschluss_out_toPoints:z"]),
+        Stage("Zu Linien konvertieren (Anschlussdaten)", pointsToLines, ("anschluss_out_toPoints", "anschluss_out_lines.shp"),
+              ["anschluss_out_toPoints:z"], ["anschluss_out_lines"]),
+        Stage("Zu Linien konvertieren (Haltungen)", pointsToLines, ("haltungen_out_toPoints", "haltungen_out_lines.shp"),
+              ["haltungen_out_toPoints:z"], ["haltungen_out_lines"]),
+    ]
+
+def vertexStages(haltung_path, anschluss_path, schacht_path):
+    """**The stages of editing the line vertices directly**, see editVertices. The lines are copied to the
+    final outputs right away and edited in place, the manholes are only read.
+
+    :returns: list of Stage
+    """
+    haltungLines = outputFeature("haltungen_out_lines")
+    anschlussLines = outputFeature("anschluss_out_lines")
+    return [
+        Stage("Kopieren (Haltungen)", copyFeature, (haltung_path, "haltungen_out_lines.shp", False), [haltung_path], ["haltungen_out_lines"]),
+        Stage("Kopieren (Anschlussdaten)", copyFeature, (anschluss_path, "anschluss_out_lines.shp", False), [anschluss_path], ["anschluss_out_lines"]),
+        Stage("3D Daten anpassen (Haltungen)", interpolateLineVerticesZ, (haltungLines, schacht_path, "schacht_X", "schacht_Y"),
+              ["haltungen_out_lines", schacht_path], ["haltungen_out_lines:z"]),
+        Stage("3D Daten anpassen (Anschlussdaten)", adjustLineVerticesZbyReference, (anschlussLines, haltungLines),
+              ["anschluss_out_lines", "haltungen_out_lines:z"], ["anschluss_out_lines:z"]),
+    ]
+
+def setupStageWorker(workerBackend, outputPath, warnings, sub):
+    """Sets the globals of a pipeline worker process like the script process does, see subvision/pipeline.py.
+
+    :param Backend workerBackend: The backend of the worker process.
+    :param string outputPath: The output folder.
+    :param bool warnings: The showWarnings parameter.
+    :param bool sub: The subInterpolate parameter.
+    :returns: void
+    """
+    global backend, progress, warningCollector, showWarnings, subInterpolate, workers
+    backend = workerBackend
+    progress = SilentProgress() # Only the script process can show progress
+    warningCollector = WarningCollector() # Sent to the script process after every stage, see takeWarnings
+    showWarnings = warnings
+    subInterpolate = sub
+    workers = 1 # Stages in worker processes don't start processes of their own
+    os.chdir(outputPath)
+    backend.setWorkspace(outputPath)
+
+def takeWarnings():
+    """:returns: The warnings collected in a pipeline worker process since the last call, see WarningCollector.take."""
+    return warningCollector.take()
+
+def reportWarnings():
+    """**Prints a summary of the collected warnings** per category and writes all of them to warningReport.
+
+    :returns: void
+    """
+    if not warningCollector.entries:
+        return
+    for message in warningCollector.summary():
+        backend.addMessage(message)
+    if warningReport:
+        warningCollector.writeCSV(warningReport)
+        backend.addMessage("Alle Warnungen: {0}".format(os.path.abspath(warningReport))) # Relative to the output folder
+
+    # -------------------------------------------------------------------------------------#
+
+def runTool(toolProfiler, haltung_path, anschluss_path, schacht_path, output_path, warnings=False, sub=False):
+    """**Runs the tool** on one set of inputs, the parameters are those of the toolbox.
+    Sets the globals the functions above work with, so only one tool can run per process at a time.
+
+    :param Profiler toolProfiler: The profiler to time the stages with, its backend is used for all geoprocessing calls.
+    :param string output_path: The output folder, has to exist.
+    :param bool warnings: [optional] The showWarnings parameter.
+    :param bool sub: [optional] The subInterpolate parameter.
+    :returns: void
+    """
+    global backend, profiler, progress, warningCollector, showWarnings, subInterpolate
+    profiler = toolProfiler
+    backend = profiler.wrap(profiler.backend) # Times cursors and geoprocessing calls per stage
+    progress = ProgressReporter(backend, interval=.25) # Updates the progress bar at most every 250 ms within loops
+    warningCollector = WarningCollector() # Warnings are summarized at the end instead of printed one by one
+    showWarnings = warnings
+    subInterpolate = sub
+
+    with profiler.timer("Setup") as timer:
+        # Initate progressor, loops switch it to a step progressor with their real item count
+        backend.setProgressor("default", "Starte Prozess...")
+
+        # Change workspace to output folder
+        os.chdir(output_path)
+        backend.setWorkspace(output_path)
+        if containerPath():
+            backend.createContainer(containerPath())
+
+        # Compare the input lines and manholes with the previous run
+        cache = None
+        if incrementalCache:
+            updateProgress("Vergleiche Eingabedaten mit dem letzten Durchlauf...")
+            haltungLines = backend.lineVertices(haltung_path)
+            anschlussLines = backend.lineVertices(anschluss_path)
+            manholeGrid = referencePointGrid(schacht_path, "schacht_X", "schacht_Y")
+            fingerprints = lineFingerprints(haltungLines, anschlussLines, manholeGrid)
+            incrementalSettings = {"xyTolerance": xyTolerance, "subInterpolate": bool(subInterpolate), "showWarnings": bool(showWarnings), "editVertices": editVertices,
+                                   "outputFormat": outputFormat, "inputs": [haltung_path, anschluss_path, schacht_path]}
+            cache = loadIncrementalCache(incrementalCache, incrementalSettings, fingerprints)
+
+        # Points converted from the same lines by an earlier run, e.g. when only subInterpolate or showWarnings changed
+        artifactKeys = {}
+        if artifactCache and not cache and not editVertices:
+            updateProgress("Suche konvertierte Punkte im Cache...")
+            version = toolVersion()
+            artifactKeys = {"haltungen_out_toPoints": artifactKey(haltung_path, "haltungen_out_toPoints", version),
+                            "anschluss_out_toPoints": artifactKey(anschluss_path, "anschluss_out_toPoints", version)}
+
+    if cache:
+        with profiler.timer("Inkrementelle Aktualisierung") as timer:
+            updateIncrementally(cache, fingerprints, haltungLines, anschlussLines, manholeGrid)
+    else:
+        # Independent stages run at the same time in worker processes, in memory feature classes can't be shared with them
+        if editVertices:
+            stages = vertexStages(haltung_path, anschluss_path, schacht_path)
+        else:
+            stages = pointStages(haltung_path, anschluss_path, schacht_path, artifactKeys)
+        pipeline = Pipeline(stages)
+        pipeline.run(backend, profiler, 1 if inMemory else workerCount(workers), setupStageWorker,
+                     (output_path, showWarnings, subInterpolate), takeWarnings, warningCollector.extend)
+        # logFeatureClasses('w') # Can be used to check if features have been copied correctly
+
+    if incrementalCache:
+        saveIncrementalCache(incrementalCache, incrementalSettings, fingerprints)
+    reportWarnings()
+
+    if profileReport:
+        profiler.writeReport(profileReport, {
+            "inputs": {"haltungen": haltung_path, "anschluesse": anschluss_path, "schaechte": schacht_path},
+            "settings": {"xyTolerance": xyTolerance, "vectorize": vectorize, "inMemory": inMemory, "outputFormat": outputFormat,
+                         "editVertices": editVertices, "streaming": streaming, "workers": workers, "subInterpolate": subInterpolate,
+                         "artifactCache": artifactCache,
+                         "incremental": bool(cache)},
+            "warnings": warningCollector.counts(),
+        }, __file__) # The tool code is in this module, the started script only calls main
+        backend.addMessage("Profil geschrieben: {0}".format(os.path.join(output_path, profileReport)))
+
+    backend.addMessage("Skript erfolgreich beendet und alle Daten verarbeitet!")
+
+    # -------------------------------------------------------------------------------------#
+
+def readManifest(path):
+    """**Reads the manifest of a batch run**, a JSON file like
+    {"output": "<folder>", "showWarnings": false, "subInterpolate": false, "jobs": [
+        {"name": "neustadt", "haltungen": "<shp>", "anschluesse": "<shp>", "schaechte": "<shp>", "output": "<folder>"}, ...]}
+    Relative paths are relative to the manifest. "output" of the manifest defaults to its folder,
+    "output" of a job defaults to the name of the job within it. showWarnings and subInterpolate can be set per job, too.
+
+    :param string path: The path of the manifest.
+    :returns: The batch output folder and the jobs as dicts with absolute paths.
+    """
+    with open(path) as file:
+        manifest = json.load(file)
+    folder = os.path.dirname(os.path.abspath(path))
+    batchOutput = os.path.join(folder, manifest.get("output", "."))
+
+    jobs = []
+    names = set()
+    for index, entry in enumerate(manifest["jobs"]):
+        name = entry.get("name") or "job{0}".format(index + 1)
+        if name in names:
+            raise ValueError('The job name "{0}" is used twice in {1}.'.format(name, path))
+        names.add(name)
+        missing = [key for key in ("haltungen", "anschluesse", "schaechte") if not entry.get(key)]
+        if missing:
+            raise ValueError('Job "{0}" in {1} has no {2}.'.format(name, path, ", ".join(missing)))
+        jobs.append({
+            "name": name,
+            "haltungen": os.path.join(folder, entry["haltungen"]),
+            "anschluesse": os.path.join(folder, entry["anschluesse"]),
+            "schaechte": os.path.join(folder, entry["schaechte"]),
+            "output": os.path.abspath(os.path.join(batchOutput, entry.get("output", name))),
+            "showWarnings": bool(entry.get("showWarnings", manifest.get("showWarnings", False))),
+            "subInterpolate": bool(entry.get("subInterpolate", manifest.get("subInterpolate", False))),
+        })
+    return os.path.abspath(batchOutput), jobs
+
+batchBackend = None # The backend of a batch process, created once and shared by all of its jobs
+
+def setupBatchWorker(backendName, pooled):
+    """Creates the backend of a batch process, see runBatch.
+
+    :param string backendName: The name of the backend, see getBackend.
+    :param bool pooled: True in the worker processes of a pool, their jobs don't start processes of their own.
+    :returns: void
+    """
+    global batchBackend, workers
+    batchBackend = getBackend(backendName)
+    if pooled:
+        workers = 1
+
+def runJob(job, jobBackend):
+    """**Runs the tool for one job**, of a batch or of the warm worker. The messages of the job are written to messages.txt
+    in its output folder. Errors are caught, so the other jobs go on.
+
+    :param dict job: The job, see readManifest.
+    :param Backend jobBackend: The backend to run the job with.
+    :returns: dict with name, output, status ("ok" or "failed"), wallTime, the wall time per stage and the error
+        and the messages of the job.
+    """
+    messages = MessageBuffer(jobBackend)
+    jobProfiler = Profiler(messages, traceMemory)
+    startTime = time.time()
+    error = None
+    try:
+        if not os.path.isdir(job["output"]):
+            os.makedirs(job["output"])
+        runTool(jobProfiler, job["haltungen"], job["anschluesse"], job["schaechte"], job["output"], job["showWarnings"], job["subInterpolate"])
+    except Exception:
+        error = traceback.format_exc()
+        messages.addMessage(error)
+    finally:
+        jobBackend.releaseFeatures() # The backend runs many jobs, their feature classes aren't needed anymore
+
+    if os.path.isdir(job["output"]):
+        with open(os.path.join(job["output"], "messages.txt"), "w") as file:
+            file.write("\n".join(messages.messages) + "\n")
+    return {
+        "name": job["name"],
+        "output": job["output"],
+        "status": "failed" if error else "ok",
+        "wallTime": time.time() - startTime,
+        "stages": [[stage.name, stage.wallTime] for stage in jobProfiler.stages],
+        "error": error,
+    }, messages.messages
+
+def runBatchJob(job):
+    """Runs one job of a batch with the backend of the batch process, see runJob.
+
+    :returns: The result of runJob without the messages.
+    """
+    return runJob(job, batchBackend)[0]
+
+def runBatch(manifestPath, jobCount=0):
+    """**Runs all jobs of a manifest**, see readManifest, in a pool of jobCount processes. Every process creates
+    its backend once and runs one job after another. Writes batch_summary.json with the timings and errors of all jobs
+    to the batch output folder.
+
+    :param string manifestPath: The path of the manifest.
+    :param int jobCount: [optional] The number of jobs to run at the same time, 0 uses all cores.
+    :returns: True if all jobs succeeded.
+    """
+    batchOutput, jobs = readManifest(manifestPath)
+    backendName = getBackend().name
+    jobCount = min(workerCount(jobCount), len(jobs))
+    print("{0} Aufträge aus {1}, {2} gleichzeitig...".format(len(jobs), manifestPath, jobCount))
+
+    results = []
+    def report(result):
+        results.append(result)
+        state = "fertig" if result["status"] == "ok" else "FEHLER, siehe {0}".format(os.path.join(result["output"], "messages.txt"))
+        print("[{0}/{1}] {2}: {3} ({4:.1f}s)".format(len(results), len(jobs), result["name"], state, result["wallTime"]))
+
+    startTime = time.time()
+    if jobCount <= 1:
+        setupBatchWorker(backendName, False)
+        for job in jobs:
+            report(runBatchJob(job))
+    else:
+        pool = processPool(jobCount, initializer=setupBatchWorker, initargs=(backendName, True))
+        try:
+            for result in pool.imap_unordered(runBatchJob, jobs):
+                report(result)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    failed = [result["name"] for result in results if result["status"] != "ok"]
+    if not os.path.isdir(batchOutput):
+        os.makedirs(batchOutput)
+    summaryPath = os.path.join(batchOutput, "batch_summary.json")
+    with open(summaryPath, "w") as file:
+        json.dump({
+            "manifest": os.path.abspath(manifestPath),
+            "jobCount": jobCount,
+            "wallTime": time.time() - startTime,
+            "succeeded": len(results) - len(failed),
+            "failed": failed,
+            "jobs": sorted(results, key=lambda result: [job["name"] for job in jobs].index(result["name"])),
+        }, file, indent=4)
+    print("{0} von {1} Aufträgen erfolgreich in {2:.1f}s, Zusammenfassung: {3}".format(len(results) - len(failed), len(jobs),
+                                                                                      time.time() - startTime, summaryPath))
+    return not failed
+
+    # -------------------------------------------------------------------------------------#
+
+def serverConnection(create=False):
+    """**Returns the address and the authkey of the warm worker.** The authkey is taken from the SUBVISION_AUTHKEY
+    environment variable. Without it, the worker creates a random key in serverKeyFile, only readable by the user,
+    and its clients read it from there.
+
+    :param bool create: [optional] True to create a new key, for the worker.
+    :returns: (address, authkey)
+    """
+    address = ("localhost", serverPort)
+    if os.environ.get("SUBVISION_AUTHKEY"):
+        return address, os.environ["SUBVISION_AUTHKEY"].encode("utf-8")
+
+    path = os.path.expanduser(serverKeyFile)
+    if create:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), 0o700)
+        if os.path.exists(path):
+            os.remove(path) # Created with the permissions of an older key otherwise
+        authkey = binascii.hexlify(os.urandom(32))
+        with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as file:
+            file.write(authkey)
+        return address, authkey
+    if not os.path.exists(path):
+        raise IOError("Kein warmer Worker gestartet, {0} fehlt. Starte ihn mit --serve.".format(path))
+    with open(path, "rb") as file:
+        return address, file.read().strip()
+
+def sendMessage(connection, message):
+    """Sends a dict as JSON, the warm worker and its clients don't exchange pickles."""
+    connection.send_bytes(json.dumps(message).encode("utf-8"))
+
+def receiveMessage(connection):
+    """:returns: The dict sent with sendMessage."""
+    return json.loads(connection.recv_bytes(1 << 20).decode("utf-8"))
+
+def serverJob(request):
+    """**Validates a request to the warm worker**, see submit.
+
+    :param request: The received request.
+    :returns: The job for runJob, None for a stop request.
+    """
+    if not isinstance(request, dict):
+        raise ValueError("Ungültiger Auftrag, erwartet wird ein JSON-Objekt.")
+    if request.get("stop") is True:
+        return None
+    job = {}
+    for key in ("name", "haltungen", "anschluesse", "schaechte", "output"):
+        if not isinstance(request.get(key), str) or not request[key]:
+            raise ValueError('Ungültiger Auftrag, "{0}" fehlt.'.format(key))
+        job[key] = request[key]
+    for key in ("haltungen", "anschluesse", "schaechte", "output"):
+        if not os.path.isabs(job[key]):
+            raise ValueError('Ungültiger Auftrag, "{0}" ist kein absoluter Pfad.'.format(key))
+    for key in ("showWarnings", "subInterpolate"):
+        if not isinstance(request.get(key, False), bool):
+            raise ValueError('Ungültiger Auftrag, "{0}" ist kein Wahrheitswert.'.format(key))
+        job[key] = request.get(key, False)
+    return job
+
+def serve():
+    """**Runs the warm worker.** Creates the backend (and imports arcpy) once, then runs the jobs sent by submit
+    one after another until it gets a stop request. Jobs sent at the same time wait for the running one.
+    Only connections from this computer with the authkey are accepted, an invalid request only fails itself.
+
+    :returns: void
+    """
+    from multiprocessing.connection import Listener, AuthenticationError
+    global batchBackend
+    batchBackend = getBackend() # arcpy if available, see subvision/backends.py
+    address, authkey = serverConnection(True)
+    listener = Listener(address, authkey=authkey)
+    print("Warmer Worker ({0}) wartet auf {1}:{2}...".format(batchBackend.name, *address))
+    try:
+        while True:
+            try:
+                connection = listener.accept()
+            except (AuthenticationError, EOFError, IOError):
+                continue # Wrong authkey or the client gave up
+            try:
+                job = serverJob(receiveMessage(connection))
+                if job is None:
+                    sendMessage(connection, {"status": "stopped"})
+                    break
+                print("Auftrag {0}...".format(job["name"]))
+                result, messages = runJob(job, batchBackend)
+                print("{0}: {1} ({2:.1f}s)".format(result["name"], "fertig" if result["status"] == "ok" else "FEHLER", result["wallTime"]))
+                result["messages"] = messages
+                sendMessage(connection, result)
+            except (EOFError, IOError):
+                pass # The client disconnected, the worker goes on with the next job
+            except Exception as error:
+                print("Auftrag abgelehnt: {0}".format(error))
+                try:
+                    sendMessage(connection, {"status": "failed", "error": str(error), "messages": [str(error)]})
+                except (EOFError, IOError):
+                    pass
+            finally:
+                connection.close()
+    finally:
+        listener.close()
+    print("Warmer Worker beendet.")
+
+def submit(request):
+    """**Sends a job to the warm worker** and waits until it is done.
+
+    :param dict request: The job, see readManifest, with absolute paths, or {"stop": True} to end the worker.
+    :returns: The result of runJob with the messages of the job in "messages".
+    """
+    from multiprocessing.connection import Client
+    address, authkey = serverConnection()
+    connection = Client(address, authkey=authkey)
+    try:
+        sendMessage(connection, request)
+        return receiveMessage(connection)
+    finally:
+        connection.close()
+
+    # -------------------------------------------------------------------------------------#
+
+def main(arguments):
+    """**Runs the tool from the command line** or the ArcGIS toolbox, see Kanalhaltungen-anpassen.py.
+
+    :param list arguments: The command line arguments without the script.
+    :returns: The exit code.
+    """
+    if len(arguments) > 1 and arguments[0] == "--batch":
+        # Batch mode, see readManifest
+        return 0 if runBatch(arguments[1], int(arguments[2]) if len(arguments) > 2 else 0) else 1
+
+    if arguments[:1] == ["--serve"]:
+        serve()
+        return 0
+
+    if arguments[:1] == ["--stop"]:
+        submit({"stop": True})
+        return 0
+
+    if len(arguments) > 4 and arguments[0] == "--submit":
+        # Paths are sent absolute, the warm worker runs in another folder
+        output = os.path.abspath(arguments[4])
+        flags = [len(arguments) > index and arguments[index].lower() == "true" for index in (5, 6)]
+        result = submit({"name": os.path.basename(output), "haltungen": os.path.abspath(arguments[1]),
+                         "anschluesse": os.path.abspath(arguments[2]), "schaechte": os.path.abspath(arguments[3]),
+                         "output": output, "showWarnings": flags[0], "subInterpolate": flags[1]})
+        for message in result["messages"]:
+            print(message)
+        return 0 if result["status"] == "ok" else 1
+
+    toolBackend = getBackend() # arcpy if available, see subvision/backends.py
+    runTool(Profiler(toolBackend, traceMemory), toolBackend.getParameterAsText(0), toolBackend.getParameterAsText(1),
+            toolBackend.getParameterAsText(2), toolBackend.getParameterAsText(3), toolBackend.getParameter(4), toolBackend.getParameter(5))
+    return 0
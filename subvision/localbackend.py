@@ -0,0 +1,433 @@
+# Local backend: the geoprocessing calls of the SubVision scripts on shapefiles, without ArcGIS.
+#
+# Feature classes are kept in memory once read and written back to disk after every change.
+# Feature classes within a GeoPackage (a path like <folder>/<name>.gpkg/<table>) are stored as its tables instead,
+# changes of single columns or points only write these (see geopackage.py).
+# Only the parts of the arcpy tools the scripts rely on are implemented.
+
+import os
+import re
+import sys
+import math
+
+import numpy
+
+from subvision import geopackage
+from subvision.backends import Backend
+from subvision.shapefiles import Field, FeatureClass, readShapefile, writeShapefile, patchPointZ, shapeVertices, shapeTypeCode, copyShape
+
+FIELD_TYPES = {"DOUBLE": "Double", "FLOAT": "Double", "LONG": "Integer", "SHORT": "SmallInteger", "TEXT": "String", "DATE": "Date"}
+
+class LocalBackend(Backend):
+    """Runs everything on shapefiles with plain Python/NumPy. Parameters are read from the command line."""
+    name = "local"
+
+    def __init__(self, arguments=None):
+        self.arguments = list(sys.argv[1:] if arguments is None else arguments)
+        self.workspace = None
+        self.features = {} # Stores {path: FeatureClass}
+        self.stamps = {} # Stores {path: (modification time, size)} of the shapefiles in features
+
+    def setWorkspace(self, path):
+        self.workspace = path
+
+    # ------------------------------------------------------------------------------------ #
+    # Feature class storage
+
+    def memoryPath(self, name):
+        return "memory\\" + name
+
+    def isMemory(self, feature):
+        return feature.split("\\")[0].lower() in ("memory", "in_memory")
+
+    def path(self, feature):
+        """The absolute .shp path of a feature class name or path, memory feature classes keep their name."""
+        if self.isMemory(feature):
+            return feature
+        if not os.path.isabs(feature) and self.workspace:
+            feature = os.path.join(self.workspace, feature)
+        feature = os.path.abspath(feature)
+        if self.containerTable(feature) is None and feature[-4:].lower() != ".shp":
+            feature += ".shp"
+        return feature
+
+    def containerTable(self, path):
+        """Splits the path of a feature class within a GeoPackage into the GeoPackage and the table.
+
+        :returns: (GeoPackage path, table name), None for shapefiles and memory feature classes.
+        """
+        if self.isMemory(path):
+            return None
+        folder, name = os.path.split(path)
+        if folder.lower().endswith(".gdb"):
+            raise ValueError("File geodatabases need the arcpy backend, use a GeoPackage (.gpkg) instead.")
+        if folder.lower().endswith(".gpkg"):
+            return folder, name
+        return None
+
+    def createContainer(self, path):
+        if not os.path.isabs(path) and self.workspace:
+            path = os.path.join(self.workspace, path)
+        if not path.lower().endswith(".gpkg"):
+            raise ValueError("{0}: the local backend only supports GeoPackages (.gpkg) as container.".format(path))
+        geopackage.createGeoPackage(path)
+
+    def releaseFeatures(self):
+        self.features.clear()
+        self.stamps.clear()
+
+    def stamp(self, path):
+        """Identifies the version of a shapefile or GeoPackage table on disk, another process (see subvision/pipeline.py) may have written it."""
+        container = self.containerTable(path)
+        if container:
+            return geopackage.tableVersion(*container)
+        status = os.stat(path)
+        return status.st_mtime, status.st_size
+
+    def load(self, feature):
+        path = self.path(feature)
+        if self.isMemory(path):
+            if path not in self.features:
+                raise ValueError("{0} does not exist.".format(feature))
+        elif path not in self.features or self.stamps.get(path) != self.stamp(path):
+            container = self.containerTable(path)
+            self.features[path] = geopackage.readTable(*container) if container else readShapefile(path)
+            self.stamps[path] = self.stamp(path)
+        return self.features[path]
+
+    def save(self, feature, featureClass):
+        path = self.path(feature)
+        self.features[path] = featureClass
+        if not self.isMemory(path):
+            container = self.containerTable(path)
+            if container:
+                geopackage.writeTable(container[0], container[1], featureClass)
+            else:
+                writeShapefile(path, featureClass)
+            self.stamps[path] = self.stamp(path)
+
+    def saveChange(self, feature, featureClass, update):
+        """Saves a change of a feature class. Within a GeoPackage only update(GeoPackage path, table) is called,
+        which writes the changed columns or rows. The whole feature class is written if update returns False.
+        """
+        path = self.path(feature)
+        container = self.containerTable(path)
+        if container and update(*container) is not False:
+            self.features[path] = featureClass
+            self.stamps[path] = self.stamp(path)
+        else:
+            self.save(feature, featureClass)
+
+    # ------------------------------------------------------------------------------------ #
+    # Tool parameters and messages
+
+    def getParameterAsText(self, index):
+        if index >= len(self.arguments) or self.arguments[index] == "#":
+            return ""
+        return self.arguments[index]
+
+    def getParameter(self, index):
+        text = self.getParameterAsText(index)
+        if text.lower() in ("true", "false"):
+            return text.lower() == "true"
+        return text or None
+
+    def addMessage(self, message):
+        print(message)
+
+    def setProgressor(self, type, label, minimum=0, maximum=100):
+        pass
+
+    def setProgressorLabel(self, label):
+        pass
+
+    def setProgressorPosition(self, position=None):
+        pass
+
+    # ------------------------------------------------------------------------------------ #
+    # Describing data
+
+    def listFeatureClasses(self):
+        folder = self.workspace or os.getcwd()
+        return sorted(name for name in os.listdir(folder) if name.lower().endswith(".shp"))
+
+    def exists(self, feature):
+        path = self.path(feature)
+        if self.isMemory(path):
+            return path in self.features
+        container = self.containerTable(path)
+        if container:
+            return os.path.exists(container[0]) and geopackage.tableVersion(*container) is not None
+        return os.path.exists(path)
+
+    def oidField(self, feature):
+        return "FID"
+
+    def listFields(self, feature):
+        return [Field("FID", "Integer"), Field("Shape", "String")] + self.load(feature).fields
+
+    def shapeType(self, feature):
+        return self.load(feature).geometryType
+
+    def addFieldDelimiters(self, feature, field):
+        return '"{0}"'.format(field)
+
+    # ------------------------------------------------------------------------------------ #
+    # Cursors
+
+    def searchCursor(self, feature, fields, sql_clause=None):
+        return LocalCursor(self, feature, fields, sql_clause, False)
+
+    def updateCursor(self, feature, fields, sql_clause=None):
+        return LocalCursor(self, feature, fields, sql_clause, True)
+
+    def featureClassToNumPyArray(self, feature, fields):
+        featureClass = self.load(feature)
+        types = []
+        for name in fields:
+            if name in ("FID", "OID@"):
+                types.append((name, "<i4"))
+                continue
+            field = featureClass.fields[featureClass.fieldIndex(name)]
+            if field.type == "Double":
+                types.append((name, "<f8"))
+            elif field.type in ("Integer", "SmallInteger"):
+                types.append((name, "<i4"))
+            else:
+                types.append((name, "<U{0}".format(field.length)))
+
+        rows = []
+        for row in LocalCursor(self, feature, fields, None, False):
+            if None in row:
+                raise ValueError("Null values in {0} can't be converted to NumPy.".format(feature))
+            rows.append(row)
+        return numpy.array(rows, dtype=types)
+
+    def lineVertices(self, feature):
+        featureClass = self.load(feature)
+        return [(fid, [[vertex[:3] for vertex in part] for part in shape or []]) for fid, shape in enumerate(featureClass.shapes)]
+
+    def updateLineZ(self, feature, zValues):
+        featureClass = self.load(feature)
+        for fid, lineZs in zValues.items():
+            shape = featureClass.shapes[fid]
+            featureClass.shapes[fid] = [[(v[0], v[1], z, v[3]) for v, z in zip(part, partZ)] for part, partZ in zip(shape, lineZs)]
+        self.save(feature, featureClass)
+
+    def adjustPointZ(self, feature, differences):
+        featureClass = self.load(feature)
+        zField = "POINT_Z" if "point_z" in [name.lower() for name in featureClass.fieldNames()] else None
+        zIndex = featureClass.fieldIndex(zField) if zField else None
+        for fid, difference in differences.items():
+            shape = featureClass.shapes[fid]
+            if shape is None:
+                continue
+            featureClass.shapes[fid] = (shape[0], shape[1], shape[2] + difference, shape[3])
+            if zIndex is not None:
+                featureClass.records[fid][zIndex] = shape[2] + difference
+
+        # Only the changed bytes or rows are written to disk
+        path = self.path(feature)
+        if self.containerTable(path):
+            self.saveChange(feature, featureClass, lambda path, table: geopackage.updatePointZ(path, table, featureClass, sorted(differences), zField))
+        elif self.isMemory(path) or not patchPointZ(path, featureClass, sorted(differences), zField):
+            self.save(feature, featureClass)
+        else:
+            self.stamps[path] = self.stamp(path)
+
+    # ------------------------------------------------------------------------------------ #
+    # Geoprocessing tools
+
+    def copyFeatures(self, input, output):
+        self.save(output, self.load(input).copy())
+
+    def featureVerticesToPoints(self, input, output):
+        lines = self.load(input)
+        points = FeatureClass(shapeTypeCode("Point", lines.hasZ), [Field(f.name, f.type, f.length, f.scale) for f in lines.fields], lines.projection)
+        points.addField(Field("ORIG_FID", "Integer"))
+        for fid, (record, shape) in enumerate(zip(lines.records, lines.shapes)):
+            for vertex in shapeVertices(shape):
+                points.records.append(list(record) + [fid])
+                points.shapes.append(tuple(vertex))
+        self.save(output, points)
+
+    def addGeometryAttributes(self, feature):
+        featureClass = self.load(feature)
+        if featureClass.geometryType != "Point":
+            raise ValueError("{0} is not a point feature class.".format(feature))
+        names = [name.lower() for name in featureClass.fieldNames()]
+        for name in ("POINT_X", "POINT_Y", "POINT_Z", "POINT_M"):
+            if name.lower() not in names:
+                featureClass.addField(Field(name, "Double"))
+        indexes = [featureClass.fieldIndex(name) for name in ("POINT_X", "POINT_Y", "POINT_Z", "POINT_M")]
+        for record, shape in zip(featureClass.records, featureClass.shapes):
+            for index, value in zip(indexes, shape or (None,) * 4):
+                record[index] = value
+        self.save(feature, featureClass)
+
+    def addField(self, feature, field, type):
+        featureClass = self.load(feature)
+        if field.lower() in [name.lower() for name in featureClass.fieldNames()]:
+            return # Like arcpy, an existing field is kept
+        featureClass.addField(Field(field, FIELD_TYPES[type.upper()]))
+        self.saveChange(feature, featureClass, lambda path, table: geopackage.addColumn(path, table, featureClass.fields[-1]))
+
+    def calculateField(self, feature, field, expression):
+        featureClass = self.load(feature)
+
+        # Replace [FIELD] and !FIELD! references by variables
+        references = []
+        def reference(match):
+            references.append(featureClass.fieldIndex(match.group(1) or match.group(2)))
+            return "_{0}".format(len(references) - 1)
+        code = compile(re.sub(r"\[(\w+)\]|!(\w+)!", reference, expression), "<expression>", "eval")
+
+        target = featureClass.fieldIndex(field)
+        for record in featureClass.records:
+            values = dict(("_{0}".format(i), record[index]) for i, index in enumerate(references))
+            record[target] = eval(code, {"__builtins__": {}, "math": math}, values)
+        self.saveChange(feature, featureClass, lambda path, table: geopackage.updateColumn(path, table, featureClass.fields[target],
+                                                                                           [record[target] for record in featureClass.records]))
+
+    def deleteField(self, feature, field):
+        featureClass = self.load(feature)
+        name = featureClass.fields[featureClass.fieldIndex(field)].name
+        featureClass.deleteField(field)
+        self.saveChange(feature, featureClass, lambda path, table: geopackage.dropColumn(path, table, name))
+
+    def adjust3DZ(self, feature, field):
+        featureClass = self.load(feature)
+        if not featureClass.hasZ:
+            raise ValueError("{0} has no Z values.".format(feature))
+        index = featureClass.fieldIndex(field)
+        for sIndex, (record, shape) in enumerate(zip(featureClass.records, featureClass.shapes)):
+            difference = record[index] or 0
+            if shape is None or difference == 0:
+                continue
+            if isinstance(shape, tuple):
+                featureClass.shapes[sIndex] = (shape[0], shape[1], shape[2] + difference, shape[3])
+            else:
+                featureClass.shapes[sIndex] = [[(v[0], v[1], v[2] + difference, v[3]) for v in part] for part in shape]
+        self.save(feature, featureClass)
+
+    def addIndex(self, feature, fields):
+        container = self.containerTable(self.path(feature))
+        if container:
+            geopackage.createIndex(container[0], container[1], fields)
+
+    def orderedFIDs(self, feature, orderBy):
+        """Sorts the features within a GeoPackage in SQLite, with the indexes of the table.
+
+        :param list orderBy: (field, descending) per sort key.
+        :returns: The FIDs in sorted order, None if the features have to be sorted in memory.
+        """
+        container = self.containerTable(self.path(feature))
+        if container:
+            return geopackage.orderedFIDs(container[0], container[1], orderBy)
+        return None
+
+    def pointsToLine(self, input, output, lineField, sortField):
+        points = self.load(input)
+        lineIndex = points.fieldIndex(lineField)
+        sortIndex = points.fieldIndex(sortField)
+
+        lines = {}
+        for record, shape in zip(points.records, points.shapes):
+            if shape is not None:
+                lines.setdefault(record[lineIndex], []).append((record[sortIndex], shape))
+
+        lineFieldType = points.fields[lineIndex]
+        result = FeatureClass(shapeTypeCode("Polyline", points.hasZ), [Field(lineFieldType.name, lineFieldType.type, lineFieldType.length, lineFieldType.scale)], points.projection)
+        for lineID in sorted(lines):
+            vertices = [shape for _, shape in sorted(lines[lineID], key=lambda point: point[0])] # Stable, keeps FID order on ties
+            if len(vertices) < 2:
+                continue # A line needs at least two points
+            result.records.append([lineID])
+            result.shapes.append([vertices])
+        self.save(output, result)
+
+class LocalCursor:
+    """Search and update cursor over a feature class, used like arcpy.da cursors."""
+    def __init__(self, backend, feature, fields, sql_clause, update):
+        self.backend = backend
+        self.feature = feature
+        self.featureClass = backend.load(feature)
+        self.update = update
+        self.changed = False
+        self.current = None
+
+        if fields == "*":
+            fields = ["FID", "Shape"] + self.featureClass.fieldNames()
+        elif isinstance(fields, str):
+            fields = fields.split(";")
+        self.fields = list(fields)
+        self.order = self.sortOrder(sql_clause[1] if sql_clause else None)
+
+    def sortOrder(self, postfix):
+        """Record indexes in the order of an "ORDER BY field [DESC], ..." clause."""
+        order = list(range(len(self.featureClass.records)))
+        if not postfix:
+            return order
+        match = re.match(r"\s*ORDER\s+BY\s+(.+)", postfix, re.IGNORECASE)
+        if not match:
+            raise ValueError("Unsupported SQL clause: {0}".format(postfix))
+        orderBy = []
+        for part in match.group(1).split(","):
+            words = part.split()
+            orderBy.append((words[0].strip('"'), len(words) > 1 and words[1].upper() == "DESC"))
+
+        # Tables of a GeoPackage are sorted by SQLite, which uses their indexes
+        fids = self.backend.orderedFIDs(self.feature, orderBy)
+        if fids is not None:
+            return fids
+        for name, descending in reversed(orderBy):
+            if name.upper() in ("FID", "OID@"):
+                key = lambda index: index
+            else:
+                fieldIndex = self.featureClass.fieldIndex(name)
+                key = lambda index, fieldIndex=fieldIndex: (self.featureClass.records[index][fieldIndex] is not None, self.featureClass.records[index][fieldIndex])
+            order.sort(key=key, reverse=descending)
+        return order
+
+    def value(self, index, field):
+        record = self.featureClass.records[index]
+        shape = self.featureClass.shapes[index]
+        token = field.upper()
+        if token in ("FID", "OID@"):
+            return index
+        if token == "SHAPE@":
+            return copyShape(shape)
+        if token.startswith("SHAPE"):
+            vertices = shapeVertices(shape)
+            if not vertices:
+                return None
+            center = tuple(sum(v[i] for v in vertices) / len(vertices) for i in range(3))
+            return {"SHAPE": center[:2], "SHAPE@XY": center[:2], "SHAPE@X": center[0], "SHAPE@Y": center[1], "SHAPE@Z": center[2]}[token]
+        return record[self.featureClass.fieldIndex(field)]
+
+    def __iter__(self):
+        for index in self.order:
+            self.current = index
+            row = [self.value(index, field) for field in self.fields]
+            yield row if self.update else tuple(row)
+        self.current = None
+
+    def updateRow(self, row):
+        if not self.update or self.current is None:
+            raise RuntimeError("updateRow needs an update cursor positioned on a row.")
+        record = self.featureClass.records[self.current]
+        for field, value in zip(self.fields, row):
+            token = field.upper()
+            if token == "SHAPE@":
+                self.featureClass.shapes[self.current] = copyShape(value)
+            elif token not in ("FID", "OID@") and not token.startswith("SHAPE"):
+                record[self.featureClass.fieldIndex(field)] = value
+        self.changed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if self.changed:
+            self.backend.save(self.feature, self.featureClass)
+            self.changed = False
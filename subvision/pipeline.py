@@ -0,0 +1,159 @@
+# Pipeline of the SubVision scripts as a graph of stages.
+#
+# Every stage declares the data it reads (inputs) and the data it writes (outputs). A stage runs as soon as the
+# stages writing its inputs are done, so stages that don't depend on each other can run at the same time in
+# worker processes. Data that no stage writes, e.g. the input feature classes of the tool, is available from the start.
+# Stages that change data in place declare a new name for the changed data as output, e.g. "haltungen_toPoints:z".
+
+import queue
+
+from subvision.backends import getBackend
+from subvision.profiling import Profiler
+from subvision.interpolation import processPool
+
+class Stage:
+    """**One step of a pipeline**, calls function(*arguments).
+
+    :param string name: The name of the stage, also the name of its Timer in the profile report.
+    :param function: The function to run. Has to be defined at module level to run in a worker process.
+    :param tuple arguments: [optional] The arguments to call function with.
+    :param list inputs: [optional] The names of the data the stage reads.
+    :param list outputs: [optional] The names of the data the stage writes.
+    """
+    def __init__(self, name, function, arguments=(), inputs=(), outputs=()):
+        self.name = name
+        self.function = function
+        self.arguments = tuple(arguments)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+class Pipeline:
+    """**Runs stages in the order of their dependencies**, independent stages at the same time if there are workers.
+
+    :param list stages: The stages, in the order to run them in without workers.
+    """
+    def __init__(self, stages):
+        self.stages = list(stages)
+        producers = {} # Stores {data name: stage index}
+        for index, stage in enumerate(self.stages):
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError('"{0}" is written by "{1}" and "{2}".'.format(output, self.stages[producers[output]].name, stage.name))
+                producers[output] = index
+        self.dependencies = [set(producers[input] for input in stage.inputs if input in producers) for stage in self.stages]
+        self.order() # Fails on cycles
+
+    def order(self):
+        """:returns: The stage indexes in an order that runs every stage after its dependencies, as close to the given order as possible."""
+        done = []
+        remaining = list(range(len(self.stages)))
+        while remaining:
+            ready = [index for index in remaining if self.dependencies[index].issubset(done)]
+            if not ready:
+                raise ValueError("The stages {0} depend on each other.".format(", ".join(self.stages[index].name for index in remaining)))
+            done.append(ready[0])
+            remaining.remove(ready[0])
+        return done
+
+    def run(self, backend, profiler, workers=1, setup=None, setupArguments=(), collect=None, merge=None):
+        """**Runs all stages.** A stage runs in this process if it is the only one that can run at the time,
+        so it can use worker processes itself. Otherwise it runs in one of workers processes.
+
+        :param Backend backend: The backend to print the messages of worker processes with.
+        :param Profiler profiler: Every stage runs in a Timer of this profiler, stages of worker processes are added to it.
+        :param int workers: [optional] The number of worker processes, 1 runs all stages one after another in this process.
+        :param setup: [optional] Called in every worker process as setup(backend, *setupArguments) before the first stage,
+            e.g. to set the globals of the script. Has to be defined at module level.
+        :param tuple setupArguments: [optional] The arguments for setup.
+        :param collect: [optional] Called in a worker process after every stage, e.g. to take the warnings of the stage.
+            Has to be defined at module level.
+        :param merge: [optional] Called in this process with the result of collect for every stage of a worker process.
+        :returns: void
+        """
+        if workers <= 1:
+            for index in self.order():
+                runStage(self.stages[index], profiler)
+            return
+
+        pool = None
+        results = queue.Queue() # Stores (stage index, result) of finished worker stages
+        done = set()
+        running = set()
+        try:
+            while len(done) < len(self.stages):
+                ready = [index for index in range(len(self.stages))
+                         if index not in done and index not in running and self.dependencies[index].issubset(done)]
+                if len(ready) == 1 and not running:
+                    runStage(self.stages[ready[0]], profiler)
+                    done.add(ready[0])
+                    continue
+
+                if ready and pool is None:
+                    pool = processPool(workers, initializer=initWorker, initargs=(backend.name, setup, setupArguments, profiler.traceMemory))
+                for index in ready:
+                    running.add(index)
+                    pool.apply_async(runWorkerStage, (self.stages[index], collect),
+                                     callback=lambda result, index=index: results.put((index, result)),
+                                     error_callback=lambda error, index=index: results.put((index, error)))
+
+                index, result = results.get()
+                running.remove(index)
+                if isinstance(result, BaseException):
+                    raise result
+                report, messages, collected = result
+                for message in messages:
+                    backend.addMessage(message)
+                profiler.addStage(report)
+                if merge is not None:
+                    merge(collected)
+                done.add(index)
+            if pool is not None:
+                pool.close()
+        except:
+            if pool is not None:
+                pool.terminate()
+            raise
+        finally:
+            if pool is not None:
+                pool.join()
+
+def runStage(stage, profiler):
+    """Runs a stage in this process, timed by profiler."""
+    with profiler.timer(stage.name) as timer:
+        stage.function(*stage.arguments)
+
+# ---------------------------------------------------------------------------------------- #
+# Worker processes
+
+workerProfiler = None # The profiler of a worker process, set by initWorker
+
+def initWorker(backendName, setup, setupArguments, traceMemory=False):
+    """Creates the backend of a worker process and passes it to setup. Messages are collected and sent back with every stage."""
+    global workerProfiler
+    messages = MessageBuffer(getBackend(backendName))
+    workerProfiler = Profiler(messages, traceMemory)
+    if setup is not None:
+        setup(workerProfiler.wrap(messages), *setupArguments)
+
+def runWorkerStage(stage, collect=None):
+    """Runs a stage in a worker process.
+
+    :param collect: [optional] Called after the stage, see Pipeline.run.
+    :returns: The profile report of the stage, the messages it printed and the result of collect.
+    """
+    backend = workerProfiler.backend
+    backend.messages = []
+    runStage(stage, workerProfiler)
+    return workerProfiler.stages.pop().report(), backend.messages, collect() if collect is not None else None
+
+class MessageBuffer:
+    """Forwards everything to a backend but collects messages, a worker process can't print to the tool window."""
+    def __init__(self, backend):
+        self.backend = backend
+        self.messages = []
+
+    def addMessage(self, message):
+        self.messages.append(message)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
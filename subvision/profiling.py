@@ -0,0 +1,286 @@
+# Profiling of the SubVision scripts.
+#
+# Every stage of a script runs in a Timer. The Timer records wall and CPU time, memory and the rows
+# processed. The peak memory of a process never goes down, so a stage records how much it raised it, and with
+# traceMemory the peak Python memory within the stage. The backend is wrapped so that time in cursor reads, cursor writes and geoprocessing calls is
+# attributed to the running stage. Stages of worker processes are measured there and added with Profiler.addStage.
+# At the end of a run, Profiler.writeReport writes everything as JSON.
+
+import os
+import sys
+import json
+import time
+import hashlib
+import platform
+import datetime
+
+try:
+    import tracemalloc
+except ImportError: # Python 2 (ArcMap)
+    tracemalloc = None
+
+CATEGORIES = ("cursorRead", "cursorWrite", "geoprocessing")
+
+# Timed backend methods as {name: (category, rows(result, arguments))}, everything else is forwarded untimed
+TIMED_METHODS = {
+    "featureClassToNumPyArray": ("cursorRead", lambda result, arguments: len(result)),
+    "lineVertices": ("cursorRead", lambda result, arguments: len(result)),
+    "updateLineZ": ("cursorWrite", lambda result, arguments: len(arguments[1])),
+    "adjustPointZ": ("cursorWrite", lambda result, arguments: len(arguments[1])),
+}
+for name in ("copyFeatures", "featureVerticesToPoints", "addGeometryAttributes", "addField", "calculateField",
+             "deleteField", "addIndex", "adjust3DZ", "pointsToLine"):
+    TIMED_METHODS[name] = ("geoprocessing", lambda result, arguments: 1) # Counts calls
+
+clock = getattr(time, "perf_counter", time.time)
+cpuClock = getattr(time, "process_time", time.clock if hasattr(time, "clock") else time.time)
+
+def peakMemory():
+    """Returns the peak memory (resident set size) of the process so far in bytes, None if it can't be determined.
+    It is the high-water mark since the process started, not of a stage."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024 # Linux reports kilobytes
+    except ImportError:
+        pass
+
+    try: # Windows
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in ("PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage",
+                                                     "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage",
+                                                     "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    except (ImportError, AttributeError, OSError):
+        pass
+    return None
+
+class Profiler:
+    """**Collects the measurements of all stages** of a run.
+
+    :param Backend backend: The backend to print the stage times with.
+    :param bool traceMemory: [optional] Also trace the peak Python memory per stage with tracemalloc. Slows allocations down.
+    """
+    def __init__(self, backend, traceMemory=False):
+        self.backend = backend
+        self.stages = [] # Stores finished Timers in order
+        self.current = None
+        self.startTime = datetime.datetime.now()
+        self.startClock = clock()
+        self.traceMemory = traceMemory and tracemalloc is not None
+        if self.traceMemory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def wrap(self, backend):
+        """Returns backend with cursors and geoprocessing calls timed into the running stage.
+
+        :param Backend backend: The backend to wrap.
+        :returns: ProfiledBackend
+        """
+        return ProfiledBackend(backend, self)
+
+    def timer(self, name):
+        """Creates the Timer for a stage, use it as context manager.
+
+        :param string name: The name of the stage.
+        :returns: Timer
+        """
+        return Timer(name, self)
+
+    def record(self, category, seconds, rows=0):
+        """Adds time and rows of a backend call to the running stage. Calls outside of stages aren't recorded."""
+        if self.current is not None:
+            self.current.times[category] += seconds
+            self.current.rows[category] += rows
+
+    def addStage(self, report):
+        """Adds a stage measured by the profiler of another process, e.g. a pipeline worker.
+
+        :param dict report: The measurements of the stage, see Timer.report.
+        :returns: void
+        """
+        timer = Timer(report["name"], self)
+        timer.wallTime = report["wallTime"]
+        timer.cpuTime = report["cpuTime"]
+        timer.processPeakMemory = report["processPeakMemory"]
+        timer.peakMemoryIncrease = report["peakMemoryIncrease"]
+        timer.peakPythonMemory = report["peakPythonMemory"]
+        timer.rows = {"cursorRead": report["rows"], "cursorWrite": report["rowsWritten"], "geoprocessing": report["geoprocessingCalls"]}
+        timer.times = {"cursorRead": report["cursorReadTime"], "cursorWrite": report["cursorWriteTime"], "geoprocessing": report["geoprocessingTime"]}
+        self.stages.append(timer)
+
+    def writeReport(self, path, info=None, script=None):
+        """**Writes the report** of all finished stages as JSON.
+
+        :param string path: The path of the JSON file.
+        :param dict info: [optional] Additional information about the run, e.g. settings and inputs.
+        :param string script: [optional] The file whose hash identifies the script version, defaults to the started script.
+        :returns: void
+        """
+        if script is None and sys.argv and sys.argv[0]:
+            script = sys.argv[0]
+        script = os.path.abspath(script) if script else None
+        report = {
+            "script": os.path.basename(script) if script else None,
+            "scriptHash": fileHash(script) if script and os.path.isfile(script) else None,
+            "started": self.startTime.isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": type(getattr(self.backend, "backend", self.backend)).__name__,
+            "info": info or {},
+            "stages": [stage.report() for stage in self.stages],
+            "total": {
+                "wallTime": clock() - self.startClock, # Stages of worker processes overlap, their sum can be longer
+                "cpuTime": sum(stage.cpuTime for stage in self.stages),
+                "peakMemory": peakMemory(),
+            },
+        }
+        with open(path, "w") as file:
+            json.dump(report, file, indent=4)
+
+def fileHash(path):
+    """Returns the SHA-1 hash of a file, identifies the script version in reports."""
+    with open(path, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+class Timer:
+    """**Measures one stage** and prints its duration when it ends. Returns itself from the with statement.
+
+    :param string name: The name of the stage.
+    :param Profiler profiler: The profiler to record into.
+    """
+    def __init__(self, name, profiler):
+        self.name = name
+        self.profiler = profiler
+        self.times = dict((category, 0.0) for category in CATEGORIES)
+        self.rows = dict((category, 0) for category in CATEGORIES)
+        self.wallTime = 0
+        self.cpuTime = 0
+        self.processPeakMemory = None # Peak of the process until the end of the stage, includes earlier stages
+        self.peakMemoryIncrease = None # How much the stage raised processPeakMemory
+        self.peakPythonMemory = None # Peak traced Python memory within the stage
+
+    def __enter__(self):
+        self.parent = self.profiler.current
+        self.profiler.current = self
+        if self.profiler.traceMemory and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        self.startPeakMemory = peakMemory()
+        self.startTime = clock()
+        self.startCpuTime = cpuClock()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.wallTime = clock() - self.startTime
+        self.cpuTime = cpuClock() - self.startCpuTime
+        self.processPeakMemory = peakMemory()
+        if self.processPeakMemory is not None and self.startPeakMemory is not None:
+            self.peakMemoryIncrease = self.processPeakMemory - self.startPeakMemory
+        if self.profiler.traceMemory:
+            self.peakPythonMemory = tracemalloc.get_traced_memory()[1]
+        self.profiler.current = self.parent
+        self.profiler.stages.append(self)
+        self.profiler.backend.addMessage("{0}: {1:.2f}s".format(self.name, self.wallTime))
+
+    def report(self):
+        """:returns: The measurements of the stage as dict."""
+        rows = self.rows["cursorRead"]
+        return {
+            "name": self.name,
+            "wallTime": self.wallTime,
+            "cpuTime": self.cpuTime,
+            "processPeakMemory": self.processPeakMemory,
+            "peakMemoryIncrease": self.peakMemoryIncrease,
+            "peakPythonMemory": self.peakPythonMemory,
+            "rows": rows,
+            "rowsPerSecond": rows / self.wallTime if self.wallTime > 0 else None,
+            "rowsWritten": self.rows["cursorWrite"],
+            "cursorReadTime": self.times["cursorRead"],
+            "cursorWriteTime": self.times["cursorWrite"],
+            "geoprocessingTime": self.times["geoprocessing"],
+            "geoprocessingCalls": self.rows["geoprocessing"],
+        }
+
+class ProfiledBackend:
+    """Forwards everything to a backend and records the time of cursors and geoprocessing calls in a Profiler."""
+    def __init__(self, backend, profiler):
+        self.backend = backend
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        attribute = getattr(self.backend, name)
+        if name not in TIMED_METHODS:
+            return attribute
+        category, rowCount = TIMED_METHODS[name]
+
+        def call(*arguments, **keywords):
+            start = clock()
+            result = attribute(*arguments, **keywords)
+            self.profiler.record(category, clock() - start, rowCount(result, arguments))
+            return result
+        return call
+
+    def searchCursor(self, feature, fields, sql_clause=None):
+        start = clock()
+        cursor = self.backend.searchCursor(feature, fields, sql_clause=sql_clause)
+        self.profiler.record("cursorRead", clock() - start)
+        return ProfiledCursor(cursor, self.profiler, False)
+
+    def updateCursor(self, feature, fields, sql_clause=None):
+        start = clock()
+        cursor = self.backend.updateCursor(feature, fields, sql_clause=sql_clause)
+        self.profiler.record("cursorRead", clock() - start)
+        return ProfiledCursor(cursor, self.profiler, True)
+
+class ProfiledCursor:
+    """Wraps a search or update cursor, fetching rows counts as read and updateRow as write."""
+    def __init__(self, cursor, profiler, update):
+        self.cursor = cursor
+        self.profiler = profiler
+        self.update = update
+
+    def __iter__(self):
+        # Time is summed up locally and recorded once, so the overhead per row stays small
+        iterator = iter(self.cursor)
+        elapsed = 0
+        rows = 0
+        try:
+            while True:
+                start = clock()
+                try:
+                    row = next(iterator)
+                except StopIteration:
+                    elapsed += clock() - start
+                    return
+                elapsed += clock() - start
+                rows += 1
+                yield row
+        finally:
+            self.profiler.record("cursorRead", elapsed, rows)
+
+    def updateRow(self, row):
+        start = clock()
+        self.cursor.updateRow(row)
+        self.profiler.record("cursorWrite", clock() - start, 1)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __enter__(self):
+        self.cursor.__enter__()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        start = clock()
+        result = self.cursor.__exit__(type, value, traceback)
+        self.profiler.record("cursorWrite" if self.update else "cursorRead", clock() - start) # Closing an update cursor flushes its edits
+        return result
@@ -0,0 +1,90 @@
+# Progress reporting for the loops of the SubVision scripts.
+#
+# Every label or position change is a round trip to the ArcGIS window. Inside loops the progress bar is
+# therefore only updated every few items and at most once per interval.
+
+import time
+
+class ProgressReporter:
+    """**Rate-limited progress bar** on top of a backend. During a stage the bar shows the real percentage of its items.
+
+    :param Backend backend: The backend to report to.
+    :param float interval: [optional] Minimum time between two updates within a stage, in seconds.
+    :param int steps: [optional] The number of positions of the bar, the item count between two updates is total / steps.
+    """
+    def __init__(self, backend, interval=.25, steps=100):
+        self.backend = backend
+        self.interval = interval
+        self.steps = steps
+        self.template = None
+        self.total = 0
+        self.stepSize = 1
+        self.nextPosition = 0
+        self.lastUpdate = 0
+
+    def setLabel(self, label):
+        """Shows a status message right away, the bar keeps its position.
+
+        :param string label: What to write into the label box.
+        :returns: void
+        """
+        if not label:
+            raise ValueError("Please specify a label when updating progress bar.")
+        self.backend.setProgressorLabel(label)
+
+    def start(self, template, total):
+        """Starts a stage with a known number of items and resets the bar to 0%.
+
+        :param string template: The label, {0} is replaced by the current item and {1} by the total.
+        :param int total: The number of items in the stage.
+        :returns: void
+        """
+        self.template = template
+        self.total = total
+        self.stepSize = max(1, total // self.steps)
+        self.nextPosition = 0
+        self.lastUpdate = 0
+        self.backend.setProgressor("step", template.format(0, total), 0, self.steps)
+
+    def update(self, position):
+        """Reports the current item of the stage. Cheap enough to be called for every item,
+        the backend is only called every total / steps items and at most once per interval.
+
+        :param int position: The index of the current item.
+        :returns: void
+        """
+        if position < self.nextPosition:
+            return
+        self.nextPosition = position + self.stepSize
+        now = time.time()
+        if now - self.lastUpdate < self.interval:
+            return
+        self.lastUpdate = now
+        self.report(position)
+
+    def finish(self):
+        """Shows the current stage as complete.
+
+        :returns: void
+        """
+        if self.template is not None:
+            self.report(self.total)
+            self.template = None
+
+    def report(self, position):
+        self.backend.setProgressorLabel(self.template.format(position, self.total))
+        self.backend.setProgressorPosition(position * self.steps // self.total if self.total else self.steps)
+
+class SilentProgress:
+    """Same interface as ProgressReporter without any output, e.g. for worker processes."""
+    def setLabel(self, label):
+        pass
+
+    def start(self, template, total):
+        pass
+
+    def update(self, position):
+        pass
+
+    def finish(self):
+        pass
@@ -0,0 +1,416 @@
+# Reading and writing of ESRI shapefiles (.shp, .shx, .dbf, .prj, .cpg) in plain Python.
+#
+# Supports point, polyline and polygon features with and without Z/M values,
+# which covers everything the SubVision scripts produce or consume.
+
+import os
+import struct
+import datetime
+
+NO_DATA = -1e39 # M values below -1e38 mean "no data" in shapefiles
+
+SHAPE_NULL = 0
+SHAPE_TYPES = {
+    1: ("Point", False, False),
+    3: ("Polyline", False, False),
+    5: ("Polygon", False, False),
+    11: ("Point", True, True),
+    13: ("Polyline", True, True),
+    15: ("Polygon", True, True),
+    21: ("Point", False, True),
+    23: ("Polyline", False, True),
+    25: ("Polygon", False, True),
+}
+
+def shapeTypeCode(geometryType, hasZ):
+    """Returns the shapefile shape type code for a geometry type name.
+
+    :param string geometryType: "Point", "Polyline" or "Polygon".
+    :param bool hasZ: Whether the features carry Z (and M) values.
+    :returns: int
+    """
+    codes = {"Point": 1, "Polyline": 3, "Polygon": 5}
+    if geometryType not in codes:
+        raise ValueError("Unsupported geometry type {0}.".format(geometryType))
+    return codes[geometryType] + (10 if hasZ else 0)
+
+class Field:
+    """A dBASE attribute field, named like the arcpy field types."""
+    def __init__(self, name, type, length=None, scale=None):
+        if type not in ("String", "Double", "Integer", "SmallInteger", "Date"):
+            raise ValueError("Unsupported field type {0}.".format(type))
+        self.name = name[:10] # dBASE limit
+        self.aliasName = self.name
+        self.type = type
+        self.length = length or {"String": 254, "Double": 19, "Integer": 10, "SmallInteger": 5, "Date": 8}[type]
+        self.scale = scale if scale is not None else (11 if type == "Double" else 0)
+
+class FeatureClass:
+    """A whole shapefile in memory.
+
+    Shapes are stored as (x, y, z, m) tuples for points and as lists of parts with (x, y, z, m) tuples for lines and polygons.
+    Z is 0.0 and M is None where the shape type doesn't store them, None is a null shape.
+    """
+    def __init__(self, shapeType, fields=None, projection=None):
+        self.shapeType = shapeType
+        self.fields = fields or []
+        self.records = []
+        self.shapes = []
+        self.projection = projection
+
+    @property
+    def geometryType(self):
+        return SHAPE_TYPES[self.shapeType][0]
+
+    @property
+    def hasZ(self):
+        return SHAPE_TYPES[self.shapeType][1]
+
+    @property
+    def hasM(self):
+        return SHAPE_TYPES[self.shapeType][2]
+
+    def fieldNames(self):
+        return [field.name for field in self.fields]
+
+    def fieldIndex(self, name):
+        """Index of a field in the records, field names are case insensitive like in dBASE."""
+        for index, field in enumerate(self.fields):
+            if field.name.lower() == name.lower():
+                return index
+        raise KeyError("Field {0} does not exist.".format(name))
+
+    def addField(self, field, default=None):
+        self.fields.append(field)
+        for record in self.records:
+            record.append(default)
+
+    def deleteField(self, name):
+        index = self.fieldIndex(name)
+        del self.fields[index]
+        for record in self.records:
+            del record[index]
+
+    def copy(self):
+        copied = FeatureClass(self.shapeType, [Field(f.name, f.type, f.length, f.scale) for f in self.fields], self.projection)
+        copied.records = [list(record) for record in self.records]
+        copied.shapes = [copyShape(shape) for shape in self.shapes]
+        return copied
+
+def copyShape(shape):
+    if shape is None or isinstance(shape, tuple):
+        return shape
+    return [list(part) for part in shape]
+
+def shapeVertices(shape):
+    """All vertices of a shape as flat list."""
+    if shape is None:
+        return []
+    if isinstance(shape, tuple):
+        return [shape]
+    return [vertex for part in shape for vertex in part]
+
+def basePath(path):
+    """The path without .shp, used for all files of a shapefile."""
+    return path[:-4] if path.lower().endswith(".shp") else path
+
+# ---------------------------------------------------------------------------------------- #
+# Reading
+
+def readShapefile(path):
+    """Reads a shapefile into memory.
+
+    :param string path: The path of the .shp file. The extension may be left out.
+    :returns: FeatureClass
+    """
+    base = basePath(path)
+    with open(base + ".shp", "rb") as file:
+        data = file.read()
+
+    fileCode, = struct.unpack(">i", data[0:4])
+    if fileCode != 9994:
+        raise ValueError("{0}.shp is not a shapefile.".format(base))
+    shapeType, = struct.unpack("<i", data[32:36])
+    if shapeType not in SHAPE_TYPES:
+        raise ValueError("Shape type {0} of {1}.shp is not supported.".format(shapeType, base))
+
+    encoding = "utf-8"
+    if os.path.exists(base + ".cpg"):
+        with open(base + ".cpg") as file:
+            encoding = file.read().strip() or encoding
+        if encoding.isdigit():
+            encoding = "cp" + encoding # Code pages are written as plain numbers, e.g. 1252
+    projection = None
+    if os.path.exists(base + ".prj"):
+        with open(base + ".prj") as file:
+            projection = file.read()
+
+    fields, records = readDbf(base + ".dbf", encoding)
+    featureClass = FeatureClass(shapeType, fields, projection)
+    featureClass.records = records
+
+    offset = 100
+    while offset + 8 <= len(data):
+        contentLength, = struct.unpack(">i", data[offset + 4:offset + 8])
+        content = data[offset + 8:offset + 8 + contentLength * 2]
+        featureClass.shapes.append(readShape(content))
+        offset += 8 + contentLength * 2
+
+    if len(featureClass.shapes) != len(featureClass.records):
+        raise ValueError("{0}: .shp and .dbf have a different number of records.".format(base))
+    return featureClass
+
+def readShape(content):
+    recordType, = struct.unpack("<i", content[0:4])
+    if recordType == SHAPE_NULL:
+        return None
+    name, hasZ, hasM = SHAPE_TYPES[recordType]
+
+    if name == "Point":
+        x, y = struct.unpack("<2d", content[4:20])
+        z = struct.unpack("<d", content[20:28])[0] if hasZ else 0.0
+        m = None
+        mOffset = 28 if hasZ else 20
+        if hasM and len(content) >= mOffset + 8:
+            m, = struct.unpack("<d", content[mOffset:mOffset + 8])
+            if m < -1e38:
+                m = None
+        return (x, y, z, m)
+
+    # Polyline and polygon
+    numParts, numPoints = struct.unpack("<2i", content[36:44])
+    parts = list(struct.unpack("<{0}i".format(numParts), content[44:44 + 4 * numParts]))
+    offset = 44 + 4 * numParts
+    xy = struct.unpack("<{0}d".format(2 * numPoints), content[offset:offset + 16 * numPoints])
+    offset += 16 * numPoints
+    zs = [0.0] * numPoints
+    ms = [None] * numPoints
+    if hasZ:
+        zs = struct.unpack("<{0}d".format(numPoints), content[offset + 16:offset + 16 + 8 * numPoints])
+        offset += 16 + 8 * numPoints
+    if hasM and len(content) >= offset + 16 + 8 * numPoints:
+        ms = [m if m >= -1e38 else None for m in struct.unpack("<{0}d".format(numPoints), content[offset + 16:offset + 16 + 8 * numPoints])]
+
+    vertices = [(xy[2 * i], xy[2 * i + 1], zs[i], ms[i]) for i in range(numPoints)]
+    parts.append(numPoints)
+    return [vertices[parts[i]:parts[i + 1]] for i in range(numParts)]
+
+def readDbf(path, encoding="utf-8"):
+    """Reads the fields and records of a dBASE file.
+
+    :returns: (list of Field, list of records)
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+
+    recordCount, headerLength, recordLength = struct.unpack("<IHH", data[4:12])
+    fields = []
+    formats = []
+    offset = 32
+    while data[offset:offset + 1] != b"\r" and offset < headerLength:
+        descriptor = data[offset:offset + 32]
+        name = descriptor[:11].split(b"\0")[0].decode("ascii")
+        code = descriptor[11:12].decode("ascii")
+        length, scale = descriptor[16], descriptor[17]
+        if code in ("N", "F"):
+            type = "Double" if scale > 0 or length > 10 else ("SmallInteger" if length <= 5 else "Integer")
+        elif code == "D":
+            type = "Date"
+        else:
+            type = "String"
+        fields.append(Field(name, type, length, scale))
+        formats.append((code, length))
+        offset += 32
+
+    records = []
+    offset = headerLength
+    for _ in range(recordCount):
+        raw = data[offset:offset + recordLength]
+        offset += recordLength
+        if raw[0:1] == b"*":
+            continue # Deleted record
+        record = []
+        position = 1
+        for field, (code, length) in zip(fields, formats):
+            record.append(parseValue(raw[position:position + length], code, field, encoding))
+            position += length
+        records.append(record)
+    return fields, records
+
+def parseValue(raw, code, field, encoding):
+    text = raw.decode(encoding, "replace").strip()
+    if code == "C":
+        return text
+    if not text or text.startswith("*"):
+        return None
+    if code in ("N", "F"):
+        if field.type == "Double":
+            return float(text)
+        return int(float(text))
+    if code == "D":
+        return datetime.datetime.strptime(text, "%Y%m%d")
+    if code == "L":
+        return text in "YyTt"
+    return text
+
+# ---------------------------------------------------------------------------------------- #
+# Writing
+
+def writeShapefile(path, featureClass):
+    """Writes a feature class to .shp, .shx, .dbf, .cpg and (if set) .prj files.
+
+    :param string path: The path of the .shp file. The extension may be left out.
+    :param FeatureClass featureClass: The features to write.
+    """
+    base = basePath(path)
+    records = []
+    for shape in featureClass.shapes:
+        records.append(packShape(shape, featureClass.shapeType))
+
+    vertices = [vertex for shape in featureClass.shapes for vertex in shapeVertices(shape)]
+    header = packHeader(featureClass.shapeType, vertices)
+
+    shpLength = 100 + sum(8 + len(record) for record in records)
+    with open(base + ".shp", "wb") as shp, open(base + ".shx", "wb") as shx:
+        shp.write(struct.pack(">i", 9994) + b"\0" * 20 + struct.pack(">i", shpLength // 2) + header)
+        shx.write(struct.pack(">i", 9994) + b"\0" * 20 + struct.pack(">i", (100 + 8 * len(records)) // 2) + header)
+        offset = 100
+        for number, record in enumerate(records):
+            shp.write(struct.pack(">2i", number + 1, len(record) // 2))
+            shp.write(record)
+            shx.write(struct.pack(">2i", offset // 2, len(record) // 2))
+            offset += 8 + len(record)
+
+    writeDbf(base + ".dbf", featureClass.fields, featureClass.records)
+    with open(base + ".cpg", "w") as file:
+        file.write("UTF-8")
+    if featureClass.projection:
+        with open(base + ".prj", "w") as file:
+            file.write(featureClass.projection)
+
+def packHeader(shapeType, vertices):
+    if vertices:
+        xs = [v[0] for v in vertices]
+        ys = [v[1] for v in vertices]
+        zs = [v[2] for v in vertices]
+        ms = [v[3] for v in vertices if v[3] is not None]
+        box = (min(xs), min(ys), max(xs), max(ys), min(zs), max(zs), min(ms) if ms else 0.0, max(ms) if ms else 0.0)
+    else:
+        box = (0.0,) * 8
+    return struct.pack("<2i8d", 1000, shapeType, *box)
+
+def packShape(shape, shapeType):
+    if shape is None:
+        return struct.pack("<i", SHAPE_NULL)
+    name, hasZ, hasM = SHAPE_TYPES[shapeType]
+
+    if name == "Point":
+        x, y, z, m = shape
+        content = struct.pack("<i2d", shapeType, x, y)
+        if hasZ:
+            content += struct.pack("<d", z)
+        if hasM:
+            content += struct.pack("<d", NO_DATA if m is None else m)
+        return content
+
+    vertices = shapeVertices(shape)
+    parts = []
+    partStart = 0
+    for part in shape:
+        parts.append(partStart)
+        partStart += len(part)
+    xs = [v[0] for v in vertices]
+    ys = [v[1] for v in vertices]
+    content = struct.pack("<i4d2i", shapeType, min(xs), min(ys), max(xs), max(ys), len(shape), len(vertices))
+    content += struct.pack("<{0}i".format(len(parts)), *parts)
+    content += b"".join(struct.pack("<2d", v[0], v[1]) for v in vertices)
+    if hasZ:
+        zs = [v[2] for v in vertices]
+        content += struct.pack("<2d", min(zs), max(zs)) + struct.pack("<{0}d".format(len(zs)), *zs)
+    if hasM:
+        ms = [NO_DATA if v[3] is None else v[3] for v in vertices]
+        content += struct.pack("<2d", min(ms), max(ms)) + struct.pack("<{0}d".format(len(ms)), *ms)
+    return content
+
+def patchPointZ(path, featureClass, fids, zField=None):
+    """**Writes changed Z values of point features into the files of a shapefile in place**, instead of rewriting them.
+    featureClass has to be the content of the shapefile, with the shapes (and zField values) at fids already changed.
+
+    :param string path: The path of the .shp file. The extension may be left out.
+    :param FeatureClass featureClass: The features of the shapefile.
+    :param list fids: The indexes of the changed features.
+    :param string zField: [optional] The name of a field storing the Z values, e.g. POINT_Z, patched as well.
+    :returns: False if the shapefile can't be patched, e.g. because it has deleted records. Nothing is written then.
+    """
+    name, hasZ, hasM = SHAPE_TYPES[featureClass.shapeType]
+    if name != "Point" or not hasZ:
+        return False
+    base = basePath(path)
+    with open(base + ".shx", "rb") as file:
+        index = file.read()
+    if len(index) != 100 + 8 * len(featureClass.shapes):
+        return False
+
+    fieldIndex = featureClass.fieldIndex(zField) if zField else None
+    with open(base + ".dbf", "r+b") as dbf:
+        recordCount, headerLength, recordLength = struct.unpack("<IHH", dbf.read(12)[4:])
+        if recordCount != len(featureClass.records):
+            return False # Deleted records, FIDs don't match the record positions
+        if fieldIndex is not None:
+            fieldOffset = 1 + sum(field.length for field in featureClass.fields[:fieldIndex])
+            field = featureClass.fields[fieldIndex]
+            for fid in fids:
+                dbf.seek(headerLength + fid * recordLength + fieldOffset)
+                dbf.write(formatValue(featureClass.records[fid][fieldIndex], field))
+
+    # The Z range in the headers of .shp and .shx follows the changed values
+    zs = [shape[2] for shape in featureClass.shapes if shape is not None]
+    zRange = struct.pack("<2d", min(zs), max(zs)) if zs else struct.pack("<2d", 0.0, 0.0)
+    with open(base + ".shx", "r+b") as shx:
+        shx.seek(68)
+        shx.write(zRange)
+    with open(base + ".shp", "r+b") as shp:
+        shp.seek(68)
+        shp.write(zRange)
+        for fid in fids:
+            shape = featureClass.shapes[fid]
+            if shape is None:
+                continue
+            offset, = struct.unpack(">i", index[100 + 8 * fid:104 + 8 * fid])
+            shp.seek(offset * 2 + 8 + 20) # Record header, shape type, X and Y
+            shp.write(struct.pack("<d", shape[2]))
+    return True
+
+def writeDbf(path, fields, records):
+    """Writes fields and records to a dBASE III file."""
+    headerLength = 32 + 32 * len(fields) + 1
+    recordLength = 1 + sum(field.length for field in fields)
+    today = datetime.date.today()
+
+    with open(path, "wb") as file:
+        file.write(struct.pack("<4BIHH20x", 3, today.year - 1900, today.month, today.day, len(records), headerLength, recordLength))
+        for field in fields:
+            code = {"String": b"C", "Date": b"D"}.get(field.type, b"N")
+            file.write(struct.pack("<11sc4xBB14x", field.name.encode("ascii"), code, field.length, field.scale))
+        file.write(b"\r")
+        for record in records:
+            file.write(b" " + b"".join(formatValue(value, field) for value, field in zip(record, fields)))
+        file.write(b"\x1a")
+
+def formatValue(value, field):
+    length = field.length
+    if field.type == "String":
+        return ("" if value is None else str(value)).encode("utf-8")[:length].ljust(length)
+    if field.type == "Date":
+        return (value.strftime("%Y%m%d") if value else "").encode("ascii").ljust(length)
+    if value is None:
+        return b" " * length
+    if field.type == "Double":
+        # Use fewer decimals if the number doesn't fit the field width
+        for scale in range(field.scale, -1, -1):
+            text = "{0:.{1}f}".format(value, scale)
+            if len(text) <= length:
+                return text.rjust(length).encode("ascii")
+        return b"*" * length
+    text = str(int(value))
+    return (text.rjust(length) if len(text) <= length else "*" * length).encode("ascii")